@@ -0,0 +1,204 @@
+"""Offline benchmark of BigQueryAdaptor overhead
+
+Run from the repository root::
+
+    PYTHONPATH=. python benchmarks/bench_bigquery_adaptor.py [--sizes 10000,100000] [--widths 50,500]
+
+All BigQuery calls are answered by :class:`FakeClient`, so the figures only measure the adaptor's own
+Python cost (row conversion, escaping, chunking, SQL generation) and the number of API round-trips.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import date
+from xialib_bigquery import BigQueryAdaptor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_client import FakeClient  # noqa: E402
+
+input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'input', 'person_simple')
+log_table_id = "bench.simple_person_log"
+table_id = "bench.simple_person"
+table_meta = {
+    "partition": {"birthday": {"type": "time", "criteria": "month"}},
+    "cluster": {"first_name": {}},
+}
+
+with open(os.path.join(input_dir, 'schema.json'), encoding='utf-8') as fp:
+    field_data = json.load(fp)
+with open(os.path.join(input_dir, '000002.json'), encoding='utf-8') as fp:
+    sample_data = json.load(fp)
+
+
+def get_adaptor(client: FakeClient) -> BigQueryAdaptor:
+    return BigQueryAdaptor(db=client)
+
+
+def get_log_data(size: int) -> list:
+    return [dict(sample_data[i % len(sample_data)], id=i, _AGE=i // 100 + 2, _NO=i % 100 + 1, _OP='')
+            for i in range(size)]
+
+
+def iter_log_data(size: int):
+    """Same rows as get_log_data, produced one by one like a decoder reading a big source file"""
+    for i in range(size):
+        yield dict(sample_data[i % len(sample_data)], id=i, _AGE=i // 100 + 2, _NO=i % 100 + 1, _OP='')
+
+
+def get_normal_data(size: int) -> list:
+    return [dict(sample_data[i % len(sample_data)], id=i, _SEQ='0' * 20, _NO=i + 1, _OP='') for i in range(size)]
+
+
+def get_wide_field_data(width: int) -> list:
+    wide_fields = [{"field_name": "id", "key_flag": True, "type_chain": ["int", "i_4"]},
+                   {"field_name": "first_name", "key_flag": True, "type_chain": ["char"]},
+                   {"field_name": "birthday", "key_flag": False, "type_chain": ["char", "c_10", "date"]}]
+    wide_fields += [{"field_name": "col/{:04}".format(i), "key_flag": False, "type_chain": ["char", "c_30"]}
+                    for i in range(width - len(wide_fields))]
+    return wide_fields
+
+
+def discovery_handler(sql: str) -> list:
+    if "DATE_TRUNC" in sql:
+        return [(date(1970 + i, 1, 1), ) for i in range(20)] + [(None, )]
+    return [("name_{}".format(i), ) for i in range(200)]
+
+
+def measure(name: str, client: FakeClient, func, data_factory, rows: int, with_memory: bool) -> dict:
+    """Run ``func`` twice on fresh input: once for timing, once under tracemalloc for peak memory"""
+    data = data_factory()
+    client.reset()
+    start = time.perf_counter()
+    result = func(data)
+    duration = time.perf_counter() - start
+    calls = client.call_counter()
+    payload = client.payload_bytes()
+    peak = None
+    if with_memory:
+        del data
+        data = data_factory()
+        tracemalloc.start()
+        func(data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "operation": name,
+        "rows": rows,
+        "result": bool(result),
+        "seconds": duration,
+        "rows_per_s": rows / duration if rows and duration else None,
+        "peak_mib": peak / 2 ** 20 if peak is not None else None,
+        "api_calls": dict(calls),
+        "payload_mib": payload / 2 ** 20,
+    }
+
+
+def bench_append(sizes: list, with_memory: bool) -> list:
+    results = []
+    client = FakeClient()
+    adaptor = get_adaptor(client)
+    for size in sizes:
+        results.append(measure("append_log_data", client,
+                               lambda data: adaptor.append_log_data(log_table_id, field_data, data),
+                               lambda: get_log_data(size), size, with_memory))
+        results.append(measure("append_normal_data", client,
+                               lambda data: adaptor.append_normal_data(table_id, {}, field_data, data, "normal"),
+                               lambda: get_normal_data(size), size, with_memory))
+        results.append(measure("append_log_data[generator]", client,
+                               lambda data: adaptor.append_log_data(log_table_id, field_data, data),
+                               lambda: iter_log_data(size), size, with_memory))
+        results.append(measure("append_log_data[load]", client,
+                               lambda data: adaptor.append_log_data(log_table_id, field_data, data,
+                                                                    ingestion_mode="load"),
+                               lambda: get_log_data(size), size, with_memory))
+    return results
+
+
+def bench_load_log_sql(widths: list, repeat: int, with_memory: bool) -> list:
+    results = []
+    client = FakeClient(query_handler=discovery_handler)
+    adaptor = get_adaptor(client)
+    for width in widths:
+        wide_fields = get_wide_field_data(width)
+
+        def build_sql(data):
+            for _ in range(repeat):
+                adaptor._get_load_log_sql(log_table_id, table_id, wide_fields, table_meta, 2, 102)
+            return True
+
+        result = measure("_get_load_log_sql[{} cols]".format(width), client, build_sql, lambda: None, 0, with_memory)
+        result["calls_per_s"] = repeat / result["seconds"] if result["seconds"] else None
+        results.append(result)
+    return results
+
+
+def bench_ddl(table_count: int, column_count: int) -> list:
+    client = FakeClient()
+    adaptor = get_adaptor(client)
+    new_fields = [{"field_name": "new_col_{}".format(i), "key_flag": False, "type_chain": ["char"]}
+                  for i in range(column_count)]
+
+    def create_tables(data):
+        return all(adaptor.create_table("{}_{}".format(table_id, i), table_meta, field_data, "raw")
+                   for i in range(table_count))
+
+    def add_columns(data):
+        return all(adaptor.add_column("{}_0".format(table_id), {}, field_line) for field_line in new_fields)
+
+    def add_columns_batch(data):
+        return len(adaptor.add_columns("{}_batch".format(table_id), {}, new_fields)) == column_count
+
+    results = [measure("create_table x{}".format(table_count), client, create_tables, lambda: None, 0, False),
+               measure("add_column x{}".format(column_count), client, add_columns, lambda: None, 0, False)]
+    adaptor.create_table("{}_batch".format(table_id), table_meta, field_data, "raw")
+    results.append(measure("add_columns [{}]".format(column_count), client, add_columns_batch, lambda: None, 0, False))
+    results[0]["calls_per_op"] = sum(results[0]["api_calls"].values()) / table_count
+    results[1]["calls_per_op"] = sum(results[1]["api_calls"].values()) / column_count
+    results[2]["calls_per_op"] = sum(results[2]["api_calls"].values()) / column_count
+    return results
+
+
+def print_report(results: list):
+    header = "{:<32} {:>9} {:>9} {:>12} {:>10} {:>10}  {}".format(
+        "operation", "rows", "seconds", "rows/s", "peak MiB", "sent MiB", "api calls")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print("{:<32} {:>9} {:>9.3f} {:>12} {:>10} {:>10.2f}  {}".format(
+            result["operation"],
+            result["rows"],
+            result["seconds"],
+            "{:.0f}".format(result["rows_per_s"]) if result["rows_per_s"] else "-",
+            "{:.1f}".format(result["peak_mib"]) if result["peak_mib"] is not None else "-",
+            result["payload_mib"],
+            ", ".join("{}={}".format(k, v) for k, v in sorted(result["api_calls"].items())),
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Row counts of append benchmarks")
+    parser.add_argument("--widths", default="20,200,1000", help="Column counts of MERGE generation benchmarks")
+    parser.add_argument("--repeat", type=int, default=100, help="MERGE generation repetitions per width")
+    parser.add_argument("--tables", type=int, default=100, help="Tables to create in the DDL benchmark")
+    parser.add_argument("--columns", type=int, default=50, help="Columns to add in the DDL benchmark")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak memory pass")
+    parser.add_argument("--json", help="Also dump raw results to this file")
+    args = parser.parse_args(argv)
+
+    with_memory = not args.no_memory
+    results = []
+    results += bench_append([int(size) for size in args.sizes.split(",")], with_memory)
+    results += bench_load_log_sql([int(width) for width in args.widths.split(",")], args.repeat, with_memory)
+    results += bench_ddl(args.tables, args.columns)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Cold start benchmark of xialib_bigquery
+
+Run from the repository root::
+
+    PYTHONPATH=. python benchmarks/bench_startup.py [--repeat 5] [--adaptors 1000]
+
+The package import is measured in fresh interpreters, together with the client libraries it loads. Adaptor
+construction is measured on :class:`FakeClient`, counting the credential lookups it triggers.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import_snippet = """
+import sys, json, time
+start = time.perf_counter()
+import xialib_bigquery
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds,
+                  "modules": [name for name in ["google.cloud.bigquery", "google.api_core.exceptions", "google.auth"]
+                              if name in sys.modules]}))
+"""
+
+
+def bench_import(repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", import_snippet], check=True, capture_output=True, text=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return {
+        "operation": "import xialib_bigquery",
+        "count": repeat,
+        "best_ms": min(run["seconds"] for run in runs) * 1000,
+        "mean_ms": sum(run["seconds"] for run in runs) / repeat * 1000,
+        "details": "loaded: " + (", ".join(runs[-1]["modules"]) or "-"),
+    }
+
+
+def bench_construction(count: int) -> dict:
+    from fake_client import FakeClient
+    from xialib_bigquery import BigQueryAdaptor
+    client = FakeClient()
+    with mock.patch("google.auth.default", return_value=(None, "auth-project")) as auth_default:
+        durations = []
+        for _ in range(count):
+            start = time.perf_counter()
+            adaptor = BigQueryAdaptor(db=client)
+            durations.append(time.perf_counter() - start)
+        first_use_project = adaptor.default_project
+        auth_calls = auth_default.call_count
+    return {
+        "operation": "BigQueryAdaptor(db=client)",
+        "count": count,
+        "best_ms": min(durations) * 1000,
+        "mean_ms": sum(durations) / count * 1000,
+        "details": "auth lookups: {}, project: {}".format(auth_calls, first_use_project),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters of the import benchmark")
+    parser.add_argument("--adaptors", type=int, default=1000, help="Adaptors created in the construction benchmark")
+    parser.add_argument("--json", help="Also dump raw results to this file")
+    args = parser.parse_args(argv)
+
+    results = [bench_import(args.repeat), bench_construction(args.adaptors)]
+    header = "{:<32} {:>7} {:>10} {:>10}  {}".format("operation", "count", "best ms", "mean ms", "details")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print("{:<32} {:>7} {:>10.3f} {:>10.3f}  {}".format(result["operation"], result["count"], result["best_ms"],
+                                                           result["mean_ms"], result["details"]))
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import gzip
+import json
+import time
+from collections import Counter
+from typing import Callable, List, Optional
+from google.cloud import bigquery
+from google.api_core.exceptions import Conflict, NotFound
+
+
+class FakeRow(tuple):
+    """Minimal stand-in of :class:`google.cloud.bigquery.Row`"""
+    def values(self):
+        return tuple(self)
+
+
+def _table_key(table) -> str:
+    if isinstance(table, str):
+        return table
+    return ".".join([table.project, table.dataset_id, table.table_id])
+
+
+class FakeQueryJob:
+    def __init__(self, rows: list):
+        self._rows = rows
+        self.job_id = "fake_job"
+        self.total_bytes_processed = 0
+        self.slot_millis = 0
+        self.num_dml_affected_rows = None
+
+    def result(self, *args, **kwargs):
+        return [FakeRow(row) for row in self._rows]
+
+
+class FakeLoadJob:
+    def __init__(self, payload: bytes):
+        self.job_id = "fake_load_job"
+        self.input_file_bytes = len(payload)
+        if payload[:2] == b"\x1f\x8b":
+            payload = gzip.decompress(payload)
+        self.output_rows = payload.count(b"\n")
+        self.output_bytes = len(payload)
+
+    def result(self, *args, **kwargs):
+        return self
+
+
+class FakeClient(bigquery.Client):
+    """In-process stand-in of :class:`bigquery.Client`
+
+    Every API call is recorded with its payload size, no network access is made.
+
+    Args:
+        project (:obj:`str`): Project to report as client project
+        query_handler (:obj:`callable`): Optional function (sql) -> rows used to answer queries
+        insert_handler (:obj:`callable`): Optional function (rows) -> insert errors to simulate row failures
+    """
+    def __init__(self, project: str = "fake-project", query_handler: Optional[Callable[[str], list]] = None,
+                 insert_handler: Optional[Callable[[list], list]] = None):
+        # The real constructor resolves credentials, which is exactly what we want to avoid here
+        self.project = project
+        self.query_handler = query_handler
+        self.insert_handler = insert_handler
+        self.calls = []
+        self.datasets = set()
+        self.tables = dict()
+
+    def _record(self, method: str, payload) -> None:
+        if isinstance(payload, (bytes, bytearray)):
+            size = len(payload)
+        elif isinstance(payload, str):
+            size = len(payload.encode())
+        else:
+            size = len(json.dumps(payload, default=str).encode())
+        self.calls.append({"method": method, "bytes": size, "time": time.perf_counter()})
+
+    def reset(self):
+        self.calls = []
+
+    def call_counter(self) -> Counter:
+        return Counter(call["method"] for call in self.calls)
+
+    def payload_bytes(self) -> int:
+        return sum(call["bytes"] for call in self.calls)
+
+    def insert_rows_json(self, table, json_rows: List[dict], **kwargs):
+        self._record("insert_rows_json", json_rows)
+        return self.insert_handler(json_rows) if self.insert_handler else []
+
+    def load_table_from_file(self, file_obj, destination, rewind: bool = False, job_config=None, **kwargs):
+        if rewind:
+            file_obj.seek(0)
+        payload = file_obj.read()
+        self._record("load_table_from_file", payload)
+        return FakeLoadJob(payload)
+
+    def query(self, query: str, job_config=None, **kwargs):
+        self._record("query", query)
+        rows = self.query_handler(query) if self.query_handler else []
+        return FakeQueryJob(rows)
+
+    def list_jobs(self, parent_job=None, **kwargs):
+        self._record("list_jobs", str(parent_job))
+        return []
+
+    def create_dataset(self, dataset, exists_ok: bool = False, **kwargs):
+        dataset_id = dataset if isinstance(dataset, str) else ".".join([dataset.project, dataset.dataset_id])
+        self._record("create_dataset", dataset_id)
+        if dataset_id in self.datasets and not exists_ok:
+            raise Conflict("Already Exists: Dataset {}".format(dataset_id))
+        self.datasets.add(dataset_id)
+        return dataset
+
+    def create_table(self, table, exists_ok: bool = False, **kwargs):
+        table_id = _table_key(table)
+        self._record("create_table", [getattr(field, "name", field) for field in getattr(table, "schema", [])])
+        if table_id in self.tables and not exists_ok:
+            raise Conflict("Already Exists: Table {}".format(table_id))
+        self.tables.setdefault(table_id, table)
+        return self.tables[table_id]
+
+    def get_table(self, table, **kwargs):
+        table_id = _table_key(table)
+        self._record("get_table", table_id)
+        if table_id not in self.tables:
+            raise NotFound("Not found: Table {}".format(table_id))
+        return self.tables[table_id]
+
+    def update_table(self, table, fields: list, **kwargs):
+        self._record("update_table", fields)
+        self.tables[_table_key(table)] = table
+        return table
+
+    def delete_table(self, table, not_found_ok: bool = False, **kwargs):
+        table_id = _table_key(table)
+        self._record("delete_table", table_id)
+        if table_id not in self.tables and not not_found_ok:
+            raise NotFound("Not found: Table {}".format(table_id))
+        self.tables.pop(table_id, None)
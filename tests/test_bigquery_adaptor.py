@@ -37,10 +37,15 @@ def adaptor():
 
 def test_ddl(adaptor: BigQueryAdaptor):
     assert adaptor.create_table(ddl_table_id, adaptor.log_table_meta, field_data, "aged")
+    assert adaptor._table_cache.get(adaptor._get_table_id(ddl_table_id, "")) is not None
     adaptor.support_add_column = False
     assert not adaptor.add_column(ddl_table_id, {}, adaptor._age_field)
     adaptor.support_add_column = True
     assert adaptor.add_column(ddl_table_id, {}, adaptor._seq_field)
+    new_fields = [{'field_name': 'new/col_' + str(i), 'key_flag': False, 'type_chain': ['char']} for i in range(3)]
+    assert adaptor.add_columns(ddl_table_id, {}, new_fields + [adaptor._seq_field]) == ["new_col_0", "new_col_1",
+                                                                                       "new_col_2"]
+    assert adaptor.add_columns(ddl_table_id, {}, new_fields) == []
     adaptor.support_alter_column = False
     assert not adaptor.alter_column(ddl_table_id, {}, {'type_chain': ['char', 'c_8']}, {'type_chain': ['char', 'c_9']})
     adaptor.support_alter_column = True
@@ -49,6 +54,7 @@ def test_ddl(adaptor: BigQueryAdaptor):
     assert "test_1_" in log_table_name
     log_table_name = adaptor.get_log_table_id("test", "")
     assert "test__" not in log_table_name
+    assert adaptor.default_project == adaptor.connection.project
 
 def test_std_case(adaptor: BigQueryAdaptor):
     with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
@@ -56,11 +62,53 @@ def test_std_case(adaptor: BigQueryAdaptor):
         for line in data_02:
             line["_SEQ"] = datetime.now().strftime('%Y%m%d%H%M%S%f')
     assert adaptor.create_table(std_table_id, {"expires_at": expires_at}, field_data, "normal")
-    assert adaptor.append_normal_data(std_table_id, {}, field_data, data_02, "normal")
+    result = adaptor.append_normal_data(std_table_id, {}, field_data, data_02, "normal")
+    assert result and result.success == 1000 and result.failed == 0
     time.sleep(2)
+    # Layout change needs a drop, refused with streaming buffer
     assert not adaptor.purge_segment(std_table_id, {}, [], "raw")
     job = adaptor.connection.query(count_sql.format((adaptor._get_table_id(std_table_id, ""))))
     assert list(job.result())[0][0] == 1000
+    # Same layout: the table is emptied in place, but the streaming buffer rows might remain
+    assert not adaptor.purge_segment(std_table_id, {}, field_data, "normal")
+
+def test_load_job_case(adaptor: BigQueryAdaptor):
+    load_table_id = std_table_id + "_load"
+    with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
+        data_02 = json.load(fp)
+        for line in data_02:
+            line["_SEQ"] = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    assert adaptor.create_table(load_table_id, {"expires_at": expires_at}, field_data, "normal")
+    result = adaptor.append_normal_data(load_table_id, {}, field_data, data_02, "normal", ingestion_mode="load")
+    assert result and result.load_stats["output_rows"] == 1000
+    # No streaming buffer: the table could be purged at once
+    assert adaptor.purge_segment(load_table_id, {}, field_data, "normal")
+    with pytest.raises(ValueError):
+        adaptor.append_normal_data(load_table_id, {}, field_data, data_02, "normal", ingestion_mode="dummy")
+
+def test_generator_input(adaptor: BigQueryAdaptor):
+    generator_table_id = std_table_id + "_generator"
+
+    def read_rows():
+        with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
+            for line in json.load(fp):
+                line["_SEQ"] = datetime.now().strftime('%Y%m%d%H%M%S%f')
+                yield line
+
+    assert adaptor.create_table(generator_table_id, {"expires_at": expires_at}, field_data, "normal")
+    result = adaptor.append_normal_data(generator_table_id, {}, field_data, read_rows(), "normal")
+    assert result.success == 1000
+
+def test_mutate_input(adaptor: BigQueryAdaptor):
+    mutate_log_table_id = std_table_id + "_mutate"
+    log_meta = adaptor.log_table_meta.copy()
+    log_meta.update({"expires_at": expires_at})
+    rows = [{"_AGE": 1, "_NO": 1, "id": 1, "first_name": "Naomi", "last_name": "Gumbrell", "birthday": "1971-05-25",
+             "_OP": ''}]
+    original_rows = json.loads(json.dumps(rows))
+    assert adaptor.create_table(mutate_log_table_id, log_meta, field_data, "aged")
+    assert adaptor.append_log_data(mutate_log_table_id, field_data, rows, mutate_input=False)
+    assert rows == original_rows and "_DT" not in rows[0]
 
 def test_aged_case(adaptor: BigQueryAdaptor):
     table_meta = {
@@ -78,7 +126,13 @@ def test_aged_case(adaptor: BigQueryAdaptor):
     assert adaptor.create_table(aged_table_id, table_meta, field_data, "raw")
     assert adaptor.create_table(aged_log_table_id, log_meta, field_data, "aged")
     assert adaptor.append_log_data(aged_log_table_id, field_data, data_02)
+    events = list()
+    adaptor.add_listener(events.append)
+    # Empty target table: loaded by a plain insert
     assert adaptor.load_log_data(aged_log_table_id, aged_table_id, field_data, table_meta, 2, 102)
+    adaptor.remove_listener(events.append)
+    assert "insert" in [event.get("kind") for event in events]
+    assert "merge" not in [event.get("kind") for event in events]
     delete_list = [
         {"_AGE": 103, "id": 1, "first_name": "Naomi", "last_name": "Gumbrell", "_OP": 'I', "_NO": 1},
         {"_AGE": 103, "id": 1, "first_name": "Naomi", "last_name": "Gumbrell", "_OP": 'D', "_NO": 2}
@@ -103,6 +157,119 @@ def test_aged_case(adaptor: BigQueryAdaptor):
     assert adaptor.append_log_data(aged_log_table_id, field_data, part_list)
     assert adaptor.load_log_data(aged_log_table_id, aged_table_id, field_data, table_meta, 105, 105)
 
+    # Partial change set: only the given fields are updated
+    partial_list = [{"_AGE": 109, "_NO": 1, "id": 2, "first_name": "Rodge", "last_name": "Fratczak",
+                     "birthday": "1971-05-25", "city": "Berlin", "email": "rodge@example.com", "_OP": 'U'}]
+    assert adaptor.append_log_data(aged_log_table_id, field_data, partial_list)
+    assert adaptor.load_log_data(aged_log_table_id, aged_table_id, field_data, table_meta, 109, 109,
+                                 update_fields=["city"])
+    job = adaptor.connection.query(select_sql.format((adaptor._get_table_id(aged_table_id, "")), "id = 2"))
+    rows = [dict(row) for row in job.result()]
+    assert rows[0]["city"] == "Berlin" and rows[0]["email"] != "rodge@example.com"
+
+def test_segment_case(adaptor: BigQueryAdaptor):
+    for segment in [segment_1, segment_2]:
+        assert adaptor.create_table(aged_table_id, {"segment": segment}, field_data, "raw")
+        table = adaptor.connection.get_table(adaptor._get_table_id(aged_table_id, segment["id"]))
+        assert table.range_partitioning.field == "height"
+    assert adaptor.purge_segments(aged_table_id, {}, [segment_1, segment_2], field_data, "raw") == {"1": True, "2": True}
+    with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
+        data_02 = json.load(fp)
+    # Load jobs: no streaming buffer, the segment tables could be dropped just after
+    results = adaptor.append_segment_data(aged_table_id, {}, [segment_1, segment_2], field_data, data_02, "raw",
+                                          ingestion_mode="load")
+    assert results["1"].success == 64 and results["2"].success == 182
+    assert results[None].failed == 1000 - 64 - 182
+    for segment in [segment_1, segment_2]:
+        assert adaptor.drop_table(aged_table_id, {"segment": segment})
+    assert adaptor._get_segment_condition({"segment": segment_1}) == "origin.height IN (150, 151, 152, 153)"
+    assert adaptor._get_segment_condition({"segment": segment_3}) == "origin.height = 170"
+    sql = adaptor._get_load_log_sql(aged_log_table_id, aged_table_id, field_data, {"segment": segment_2}, 2, 102)
+    assert "origin.height BETWEEN 160 AND 169" in sql
+    sql = adaptor._get_load_log_sql(aged_log_table_id, aged_table_id, field_data, {}, 2, 102, update_fields=["city"])
+    assert "PARTITION BY id, first_name, last_name " in sql and "UPDATE SET city = log_table.city " in sql
+
+def test_script_case(adaptor: BigQueryAdaptor):
+    script_adaptor = BigQueryAdaptor(db=adaptor.connection, use_script=True)
+    table_meta = {"partition": {"birthday": {"type": "time", "criteria": "month"}}, "cluster": {"first_name": {}}}
+    update_list = [{"_AGE": 106, "id": 2, "first_name": "Rodge", "last_name": "Fratczak", "birthday": "1971-05-25",
+                    "city": "Lyon", "_OP": 'U'}]
+    script = script_adaptor._get_load_log_script(aged_log_table_id, aged_table_id, field_data, table_meta, 106, 106)
+    assert "BEGIN TRANSACTION" in script and "EXECUTE IMMEDIATE" in script
+    assert script_adaptor.append_log_data(aged_log_table_id, field_data, update_list)
+    handle = script_adaptor.submit_load_log_data(aged_log_table_id, aged_table_id, field_data, table_meta, 106, 106)
+    assert handle.result()
+    assert "MERGE" in [stats["statement_type"] for stats in handle.script_stats]
+
+def test_instrumentation(adaptor: BigQueryAdaptor):
+    events = list()
+    adaptor.add_listener(events.append)
+    table_meta = {"partition": {"birthday": {"type": "time", "criteria": "month"}}}
+    update_list = [{"_AGE": 107, "id": 3, "first_name": "Pia", "last_name": "Bourget", "birthday": "1972-06-07",
+                    "city": "Nice", "_OP": 'U'}]
+    with adaptor.track("cycle") as stats:
+        assert adaptor.append_log_data(aged_log_table_id, field_data, update_list)
+        assert adaptor.load_log_data(aged_log_table_id, aged_table_id, field_data, table_meta, 107, 107)
+    adaptor.remove_listener(events.append)
+    summary = stats.summary()
+    assert summary["api_calls"]["insert_chunk"] == 1 and summary["rows"] == 1
+    assert summary["total_bytes_processed"] > 0
+    assert len(events) == len(stats.events)
+    assert "merge" in [event.get("kind") for event in events]
+
+def test_scan_budget(adaptor: BigQueryAdaptor):
+    budget_adaptor = BigQueryAdaptor(db=adaptor.connection, scan_budget=1)
+    table_meta = {"partition": {"birthday": {"type": "time", "criteria": "month"}}}
+    handle = budget_adaptor.submit_load_log_data(aged_log_table_id, aged_table_id, field_data, table_meta, 108, 108)
+    assert not handle.result()
+    assert handle.dry_run["estimated_bytes"] > 1
+    table_meta["scan_budget"] = 2 ** 40
+    assert budget_adaptor.load_log_data(aged_log_table_id, aged_table_id, field_data, table_meta, 108, 108)
+
+def test_value_index(adaptor: BigQueryAdaptor):
+    index_adaptor = BigQueryAdaptor(db=adaptor.connection, value_index=True)
+    table_meta = {"partition": {"birthday": {"type": "time", "criteria": "month"}}, "cluster": {"first_name": {}}}
+    log_meta = index_adaptor.log_table_meta.copy()
+    log_meta.update({"expires_at": expires_at})
+    index_log_table_id = aged_log_table_id + "_idx"
+    with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
+        data_02 = json.load(fp)
+        for line in data_02:
+            line["_AGE"], line["_NO"], line["_OP"] = line["id"] // 10 + 2, line["id"] % 10 + 1, ""
+    assert index_adaptor.create_table(index_log_table_id, log_meta, field_data, "aged")
+    assert index_adaptor.append_log_data(index_log_table_id, field_data, data_02)
+    assert "Naomi" in index_adaptor._get_log_values(index_log_table_id, "first_name", 2, 2)
+    assert index_adaptor._get_log_values(index_log_table_id, "email", 2, 2) is None
+    assert index_adaptor.load_log_data(index_log_table_id, aged_table_id, field_data, table_meta, 2, 102)
+    assert not index_adaptor._get_log_values(index_log_table_id, "first_name", 2, 102)
+
+def test_append_mode(adaptor: BigQueryAdaptor):
+    append_table_id = "..test.simple_person_append_" + rand
+    append_log_table_id = append_table_id + "_log"
+    table_meta = {"table_mode": "append", "partition": {"birthday": {"type": "time", "criteria": "month"}},
+                  "expires_at": expires_at}
+    log_meta = adaptor.log_table_meta.copy()
+    log_meta.update({"expires_at": expires_at})
+    with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
+        data_02 = json.load(fp)
+        for line in data_02:
+            line["_AGE"], line["_NO"], line["_OP"] = line["id"] // 10 + 2, line["id"] % 10 + 1, ""
+    delete_list = [{"_AGE": 103, "id": 1, "first_name": "Naomi", "last_name": "Gumbrell", "_OP": 'D', "_NO": 1}]
+    assert adaptor.create_table(append_table_id, table_meta, field_data, "raw")
+    assert adaptor.create_table(append_log_table_id, log_meta, field_data, "aged")
+    # Load job: no streaming buffer, the log table could be dropped at the end
+    assert adaptor.append_log_data(append_log_table_id, field_data, data_02 + delete_list, ingestion_mode="load")
+    assert adaptor.load_log_data(append_log_table_id, append_table_id, field_data, table_meta, 2, 103)
+    assert not adaptor.load_log_data(append_log_table_id, append_table_id, field_data, table_meta, 104, 104,
+                                     update_fields=["city"])
+    job = adaptor.connection.query(count_sql.format(adaptor.get_view_id(append_table_id, "")))
+    assert list(job.result())[0][0] == 999
+    assert adaptor.compact_table(append_table_id, table_meta, field_data)
+    job = adaptor.connection.query(count_sql.format(adaptor._get_table_id(append_table_id, "")))
+    assert list(job.result())[0][0] == 999
+    assert adaptor.drop_table(append_table_id, table_meta)
+    assert adaptor.drop_table(append_log_table_id, {})
+
 def test_excpetions(adaptor: BigQueryAdaptor):
     assert adaptor._escape_column_name(r"/TEST/Hello") == "_TEST_Hello"
     assert adaptor._escape_column_name(r"0Hello") == "_0Hello"
@@ -111,4 +278,10 @@ def test_excpetions(adaptor: BigQueryAdaptor):
     assert len(adaptor._escape_column_name(long_str)) == 128
     assert adaptor.drop_table("Dummy", {})
     with pytest.raises(TypeError):
-        adap = BigQueryAdaptor(db=object())
\ No newline at end of file
+        adap = BigQueryAdaptor(db=object())
+    with pytest.raises(ValueError):
+        adap = BigQueryAdaptor(db=adaptor.connection, budget_action="ignore")
+    with pytest.raises(ValueError):
+        adap = BigQueryAdaptor(db=adaptor.connection, load_compression="zip")
+    with pytest.raises(ValueError):
+        adaptor.create_table(ddl_table_id, {"table_mode": "replace"}, field_data, "raw")
@@ -0,0 +1,38 @@
+import os
+import json
+import pytest
+from google.cloud import bigquery
+from xialib_bigquery import BigQueryAdaptor, MergeCoalescer
+
+aged_table_id = "..test.simple_person_aged"
+missing_log_table_id = "..test.simple_person_aged_missing"
+
+with open(os.path.join('.', 'input', 'person_simple', 'schema.json'), encoding='utf-8') as fp:
+    field_data = json.load(fp)
+
+@pytest.fixture(scope='module')
+def adaptor():
+    conn = bigquery.Client()
+    adaptor = BigQueryAdaptor(db=conn)
+    yield adaptor
+
+def test_coalesce_ranges(adaptor: BigQueryAdaptor):
+    coalescer = MergeCoalescer(adaptor, max_ranges=10, max_latency=3600, drain_at_exit=False)
+    assert coalescer.add(missing_log_table_id, aged_table_id, field_data, {}, 103, 104)
+    assert coalescer.add(missing_log_table_id, aged_table_id, field_data, {}, 105, 105)
+    target = adaptor._get_table_id(aged_table_id, "")
+    assert [(group["start_age"], group["end_age"]) for group in coalescer._pending[target]] == [(103, 105)]
+    # Failed merge: the coalesced range stays pending
+    assert not coalescer.flush(aged_table_id, {})
+    assert coalescer._pending[target][0]["end_age"] == 105
+    coalescer._pending.clear()
+    assert coalescer.close()
+
+def test_coalesce_errors(adaptor: BigQueryAdaptor):
+    coalescer = MergeCoalescer(adaptor, max_ranges=1, max_latency=3600, drain_at_exit=False)
+    table_meta = {"partition": {"birthday": {"type": "time", "criteria": "month"}}}
+    # Partition discovery on a missing log table raises: counted as a failed merge, the range stays pending
+    assert not coalescer.add(missing_log_table_id, aged_table_id, field_data, table_meta, 103, 104)
+    assert coalescer._pending[adaptor._get_table_id(aged_table_id, "")][0]["end_age"] == 104
+    coalescer._pending.clear()
+    assert coalescer.close()
@@ -0,0 +1,47 @@
+import os
+import json
+import pytest
+from google.cloud import bigquery
+from xialib_bigquery import BigQueryAdaptor, LogRotationManager
+
+rotation_table_id = "..test.simple_person_rotation"
+
+with open(os.path.join('.', 'input', 'person_simple', 'schema.json'), encoding='utf-8') as fp:
+    field_data = json.load(fp)
+
+@pytest.fixture(scope='module')
+def adaptor():
+    conn = bigquery.Client()
+    adaptor = BigQueryAdaptor(db=conn)
+    adaptor.drop_table(rotation_table_id, {})
+    yield adaptor
+
+def test_rotation(adaptor: BigQueryAdaptor):
+    with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
+        data_02 = json.load(fp)
+        for line in data_02:
+            line["_AGE"], line["_NO"], line["_OP"] = line["id"] // 10 + 2, line["id"] % 10 + 1, ""
+    assert adaptor.create_table(rotation_table_id, {}, field_data, "raw")
+    manager = LogRotationManager(adaptor, rotation_table_id, field_data, rotate_rows=500)
+    assert manager.append(data_02[:500])
+    assert manager.append(data_02[500:])
+    assert len(manager.log_tables) == 2 and manager.log_tables[0]["sealed"]
+    assert manager.load({}, 2, 52)
+    # First log table is fully merged and dropped, the second one is kept
+    assert len(manager.log_tables) == 1 and manager.high_water_mark == 52
+    assert manager.load({}, 53, 102)
+    job = adaptor.connection.query("SELECT COUNT(id) FROM {}".format(adaptor._get_table_id(rotation_table_id, "")))
+    assert list(job.result())[0][0] == 1000
+    manager.seal()
+    assert manager.cleanup()
+    assert not manager.log_tables
+
+def test_rotation_gap(adaptor: BigQueryAdaptor):
+    manager = LogRotationManager(adaptor, rotation_table_id, field_data)
+    manager.log_tables = [{"log_table_id": rotation_table_id + "_gap", "created": 0, "sealed": True, "rows": 590,
+                           "min_age": 2, "max_age": 60, "partitions": {}}]
+    # Ages 2-49 are not merged yet: the log table must be kept
+    manager.mark_merged(50, 60)
+    assert manager.high_water_mark < 50 and manager.merged_ranges == [[50, 60]]
+    manager.mark_merged(2, 49)
+    assert manager.high_water_mark == 60 and not manager.merged_ranges
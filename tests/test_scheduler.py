@@ -0,0 +1,47 @@
+import os
+import json
+import threading
+import pytest
+from google.cloud import bigquery
+from xialib_bigquery import BigQueryAdaptor, LoadScheduler
+
+aged_table_id = "..test.simple_person_aged"
+missing_log_table_id = "..test.simple_person_aged_missing"
+
+with open(os.path.join('.', 'input', 'person_simple', 'schema.json'), encoding='utf-8') as fp:
+    field_data = json.load(fp)
+
+@pytest.fixture(scope='module')
+def adaptor():
+    conn = bigquery.Client()
+    adaptor = BigQueryAdaptor(db=conn)
+    yield adaptor
+
+def test_submit_handle(adaptor: BigQueryAdaptor):
+    handle = adaptor.submit_load_log_data(missing_log_table_id, aged_table_id, field_data, {}, 1, 1)
+    assert not handle.result()
+    assert handle.done()
+
+def test_scheduler_ordering(adaptor: BigQueryAdaptor, monkeypatch):
+    release = threading.Event()
+    load_log_data = adaptor.load_log_data
+
+    def blocked_load_log_data(*args):
+        # The first load can't end before the second one is queued
+        release.wait()
+        return load_log_data(*args)
+
+    monkeypatch.setattr(adaptor, "load_log_data", blocked_load_log_data)
+    with LoadScheduler(adaptor, max_concurrency=4) as scheduler:
+        first = scheduler.submit(missing_log_table_id, aged_table_id, field_data, {}, 1, 1)
+        second = scheduler.submit(missing_log_table_id, aged_table_id, field_data, {}, 2, 2)
+        release.set()
+    assert not first.result() and not second.result()
+    assert [record["status"] for record in scheduler.report()] == ["failed", "skipped"]
+
+def test_scheduler_tracking(adaptor: BigQueryAdaptor):
+    with adaptor.track("scheduled loads") as stats:
+        with LoadScheduler(adaptor, max_concurrency=4) as scheduler:
+            scheduler.submit(missing_log_table_id, aged_table_id, field_data, {}, 1, 1)
+    # Events of the worker threads are aggregated by the caller
+    assert stats.summary()["api_calls"].get("query", 0) > 0
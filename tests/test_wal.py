@@ -0,0 +1,48 @@
+import os
+import json
+import pytest
+from google.cloud import bigquery
+from xialib_bigquery import BigQueryAdaptor, WriteAheadBuffer
+
+wal_log_table_id = "..test.simple_person_wal_log"
+
+with open(os.path.join('.', 'input', 'person_simple', 'schema.json'), encoding='utf-8') as fp:
+    field_data = json.load(fp)
+
+@pytest.fixture(scope='module')
+def adaptor():
+    conn = bigquery.Client()
+    adaptor = BigQueryAdaptor(db=conn)
+    adaptor.drop_table(wal_log_table_id, {})
+    yield adaptor
+
+def test_write_ahead_buffer(adaptor: BigQueryAdaptor, tmp_path):
+    wal_dir = str(tmp_path)
+    with open(os.path.join('.', 'input', 'person_simple', '000002.json'), encoding='utf-8') as fp:
+        data_02 = json.load(fp)
+        for line in data_02:
+            line["_AGE"], line["_NO"], line["_OP"] = line["id"] // 10 + 2, line["id"] % 10 + 1, ""
+    assert adaptor.create_table(wal_log_table_id, adaptor.log_table_meta, field_data, "aged")
+    buffer = WriteAheadBuffer(adaptor, wal_dir, segment_rows=400, flush_interval=3600, ingestion_mode="load")
+    for i in range(0, 1000, 100):
+        assert buffer.append(wal_log_table_id, field_data, data_02[i:i + 100]) == 100
+    # Simulated crash: buffered rows are only on disk
+    buffer.close(drain=False)
+    recovered_buffer = WriteAheadBuffer(adaptor, wal_dir, flush_interval=3600, ingestion_mode="load")
+    assert recovered_buffer.pending()["rows"] + buffer.stats["rows_sent"] == 1000
+    assert recovered_buffer.flush(wal_log_table_id)
+    assert recovered_buffer.pending() == {"segments": 0, "rows": 0}
+    assert recovered_buffer.close()
+    job = adaptor.connection.query("SELECT COUNT(*) FROM {}".format(adaptor._get_table_id(wal_log_table_id, "")))
+    assert list(job.result())[0][0] == 1000
+
+def test_dead_letter(adaptor: BigQueryAdaptor, tmp_path):
+    wal_dir = str(tmp_path)
+    buffer = WriteAheadBuffer(adaptor, wal_dir, flush_interval=3600, max_attempts=2)
+    assert buffer.append(wal_log_table_id + "_missing", field_data, [{"id": 1, "_AGE": 1, "_NO": 1, "_OP": ""}]) == 1
+    assert not buffer.flush()
+    assert buffer.pending()["segments"] == 1
+    assert not buffer.flush()
+    assert buffer.pending()["segments"] == 0 and buffer.stats["segments_dead"] == 1
+    assert [file_name for file_name in os.listdir(wal_dir) if file_name.endswith(buffer.dead_suffix)]
+    assert buffer.close()
@@ -1,5 +1,10 @@
-from xialib_bigquery.bigquery_adaptor import BigQueryAdaptor
+from xialib_bigquery.bigquery_adaptor import BigQueryAdaptor, InsertResult, LoadHandle, OperationStats
+from xialib_bigquery.scheduler import LoadScheduler
+from xialib_bigquery.coalescer import MergeCoalescer
+from xialib_bigquery.rotation import LogRotationManager
+from xialib_bigquery.wal import WriteAheadBuffer
 
-__all__ = ['BigQueryAdaptor']
+__all__ = ['BigQueryAdaptor', 'InsertResult', 'LoadHandle', 'OperationStats', 'LoadScheduler', 'MergeCoalescer',
+           'LogRotationManager', 'WriteAheadBuffer']
 
 __version__ = "0.1.0"
@@ -1,12 +1,324 @@
+import os
+import gzip
 import json
-from typing import List, Union
+import time
+import uuid
+import queue
+import tempfile
+import importlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Union, Iterable
 from datetime import datetime, timedelta
-from google.cloud import bigquery
-import google.auth
-from google.api_core.exceptions import Conflict, BadRequest, NotFound
 from xialib.adaptor import Adaptor
 
 
+class _LazyModule:
+    """Module imported at the first access to one of its attributes"""
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# Heavy client libraries are only imported when first used, not at package import
+bigquery = _LazyModule("google.cloud.bigquery")
+exceptions = _LazyModule("google.api_core.exceptions")
+
+# Operation statistics collectors of the current execution context
+_active_operations = contextvars.ContextVar("xia_bigquery_operations", default=())
+
+
+class OperationStats:
+    """Instrumentation events aggregated over one high-level call
+
+    Attributes:
+        name (:obj:`str`): Operation name given to :meth:`BigQueryAdaptor.track`
+        events (:obj:`list`): All events (insert_chunk, load_job, query, ddl) emitted during the operation
+        duration (:obj:`float`): Wall-clock seconds of the operation, None while it is running
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.events = list()
+        self.duration = None
+        self._start_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, event: dict):
+        with self._lock:
+            self.events.append(event)
+
+    def close(self):
+        self.duration = time.monotonic() - self._start_time
+
+    def summary(self) -> dict:
+        """Totals of the operation: api calls per event type, api time, rows, bytes and job statistics"""
+        with self._lock:
+            events = list(self.events)
+        jobs = [event["job"] for event in events if event.get("job")]
+        return {
+            "name": self.name,
+            "duration": self.duration,
+            "api_calls": dict(Counter(event["type"] for event in events)),
+            "api_time": sum(event["duration"] for event in events),
+            "rows": sum(event.get("rows", 0) for event in events),
+            "bytes": sum(event.get("bytes", 0) for event in events),
+            "total_bytes_processed": sum(job.get("total_bytes_processed") or 0 for job in jobs),
+            "slot_millis": sum(job.get("slot_millis") or 0 for job in jobs),
+            "num_dml_affected_rows": sum(job.get("num_dml_affected_rows") or 0 for job in jobs),
+            "errors": sum(1 for event in events if event.get("error")),
+        }
+
+
+class InsertResult:
+    """Outcome of a row insert operation
+
+    Evaluated as True when no row has failed, so it could be used like the usual boolean result.
+
+    Attributes:
+        success (:obj:`int`): Number of inserted rows
+        retried (:obj:`int`): Number of row re-submissions
+        failed (:obj:`int`): Number of rows which could not be inserted
+        errors (:obj:`list`): Error details of failed rows, only the first ``max_errors`` ones are kept
+        load_stats (:obj:`dict`): Statistics of the load job (``load`` ingestion mode), empty for streaming inserts
+    """
+    max_errors = 100
+
+    def __init__(self, success: int = 0, retried: int = 0, failed: int = 0, errors: list = None,
+                 load_stats: dict = None):
+        self.success = success
+        self.retried = retried
+        self.failed = failed
+        self.errors = errors if errors is not None else []
+        self.load_stats = load_stats if load_stats is not None else {}
+
+    def __bool__(self):
+        return self.failed == 0
+
+    def __iadd__(self, other: 'InsertResult'):
+        self.success += other.success
+        self.retried += other.retried
+        self.failed += other.failed
+        self.errors.extend(other.errors[:max(self.max_errors - len(self.errors), 0)])
+        return self
+
+    def __repr__(self):
+        return "InsertResult(success={}, retried={}, failed={})".format(self.success, self.retried, self.failed)
+
+
+class _LRUCache:
+    """Thread-safe LRU cache with optional time-to-live
+
+    Args:
+        max_size (:obj:`int`): Maximum number of entries, the least recently used ones are evicted first
+        ttl (:obj:`float`): Seconds before an entry expires, never expires if None
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, expires_at = self._data[key]
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _EscapedNames(dict):
+    """Column name escaping memo: escaped once per distinct key"""
+    def __init__(self, escape_func):
+        super().__init__()
+        self.escape_func = escape_func
+
+    def __missing__(self, key):
+        value = self[key] = self.escape_func(key)
+        return value
+
+
+class _RowEncoder:
+    """Row encoder compiled once per field data
+
+    Holds the date/time converters and the escaped column names, so that the per-row work is reduced
+    to a single dictionary pass.
+
+    Args:
+        adaptor (:obj:`BigQueryAdaptor`): Adaptor providing conversion functions and column name escaping
+        field_data (:obj:`list`): Field definitions of the table
+    """
+    def __init__(self, adaptor: 'BigQueryAdaptor', field_data: List[dict]):
+        conv_func_dict = adaptor.get_dt_conv_func_dict(field_data)
+        self.converters = [(field['field_name'], conv_func_dict[field['field_name']])
+                           for field in field_data if field['field_name'] in conv_func_dict]
+        self.conv_func_dict = dict(self.converters)
+        self.names = _EscapedNames(adaptor._escape_column_name)
+        for field in field_data:
+            self.names[field['field_name']]
+
+    def encode(self, data, dt: str = "", mutate_input: bool = True):
+        """Generator of encoded rows
+
+        Args:
+            data (:obj:`Iterable`): Source rows, consumed lazily
+            dt (:obj:`str`): Value of ``_DT`` field to set, no ``_DT`` is set when empty
+            mutate_input (:obj:`bool`): Source rows are converted in place as well (historical behavior)
+        """
+        names = self.names
+        if mutate_input:
+            converters = self.converters
+            for line in data:
+                if dt:
+                    line["_DT"] = dt
+                for field, func in converters:
+                    if field in line:
+                        line[field] = func(line[field])
+                yield {names[k]: v for k, v in line.items()}
+        else:
+            conv_func_dict = self.conv_func_dict
+            for line in data:
+                row = {names[k]: (conv_func_dict[k](v) if k in conv_func_dict else v) for k, v in line.items()}
+                if dt:
+                    row["_DT"] = dt
+                yield row
+
+
+class _LogValueIndex:
+    """Distinct values of partition / cluster candidate fields of a log table, observed at append time
+
+    For each value, the lowest and the highest age where it appears is kept. The values found for an age
+    range are therefore a superset of the real ones, which is always safe for the partition pruning.
+
+    Args:
+        fields (:obj:`dict`): field name -> column name of the tracked fields
+        time_fields (:obj:`list`): tracked fields holding date / datetime values, kept at day level
+        max_values (:obj:`int`): above this number of distinct values, the field is no more tracked
+    """
+    def __init__(self, fields: dict, time_fields: list, max_values: int = 10000):
+        self.fields = fields
+        self.time_fields = set(time_fields)
+        self.max_values = max_values
+        self.complete = True
+        self.overflow = set()
+        self.values = {field: dict() for field in fields}
+        self._lock = threading.Lock()
+
+    def track(self, rows):
+        """Generator passing the rows through while recording their values"""
+        for row in rows:
+            self.add(row)
+            yield row
+
+    def add(self, row: dict):
+        age = row.get("_AGE", None)
+        if age is None:
+            self.complete = False
+            return
+        with self._lock:
+            for field, column in self.fields.items():
+                value = row.get(column, None)
+                if value is not None and field in self.time_fields:
+                    value = str(value)[:10]
+                ages = self.values[field].get(value, None)
+                if ages is not None:
+                    ages[0], ages[1] = min(ages[0], age), max(ages[1], age)
+                elif len(self.values[field]) < self.max_values:
+                    self.values[field][value] = [age, age]
+                else:
+                    self.overflow.add(field)
+
+    def get_values(self, field: str, start_age: int, end_age: int) -> Union[set, None]:
+        """Values of field between start age and end age, None if the index could not tell"""
+        if not self.complete or field not in self.values or field in self.overflow:
+            return None
+        with self._lock:
+            return {value for value, ages in self.values[field].items() if ages[0] <= end_age and ages[1] >= start_age}
+
+    def prune(self, end_age: int):
+        """Remove values only seen in already loaded ages"""
+        with self._lock:
+            for field_values in self.values.values():
+                for value in [value for value, ages in field_values.items() if ages[1] <= end_age]:
+                    del field_values[value]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"fields": self.fields, "time_fields": sorted(self.time_fields), "max_values": self.max_values,
+                    "complete": self.complete, "overflow": sorted(self.overflow),
+                    "values": {field: [[value] + ages for value, ages in field_values.items()]
+                               for field, field_values in self.values.items()}}
+
+    @classmethod
+    def from_dict(cls, index_dict: dict) -> '_LogValueIndex':
+        index = cls(index_dict["fields"], index_dict["time_fields"], index_dict["max_values"])
+        index.complete = index_dict["complete"]
+        index.overflow = set(index_dict["overflow"])
+        index.values = {field: {line[0]: line[1:] for line in field_values}
+                        for field, field_values in index_dict["values"].items()}
+        return index
+
+
+class LoadHandle:
+    """Handle of a submitted load_log_data
+
+    Args:
+        job (:obj:`bigquery.QueryJob`): Submitted merge (or script) job, None if no job is pending
+        complete_func (:obj:`callable`): Function waiting the job and finishing the load, returns bool
+        result (:obj:`bool`): Result of a load finished without pending job (failed submission, split load)
+        dry_run (:obj:`dict`): Scan budget check of the load: table_id, start_age, end_age, estimated_bytes and
+            scan_budget. Empty if not checked.
+
+    Attributes:
+        script_stats (:obj:`list`): Statistics of each statement of a script load, set by ``result()``
+    """
+    def __init__(self, job, complete_func, result: bool = False, dry_run: dict = None):
+        self.job = job
+        self.dry_run = dry_run if dry_run is not None else {}
+        self.script_stats = []
+        self._complete_func = complete_func
+        self._result = None if job is not None else result
+        self._lock = threading.Lock()
+
+    def done(self) -> bool:
+        """Non-blocking check of the job completion"""
+        return self._result is not None or self.job.done()
+
+    def result(self) -> bool:
+        """Wait for the end of the load, the post-merge steps are run only once"""
+        with self._lock:
+            if self._result is None:
+                self._result = self._complete_func()
+            return self._result
+
+
 class BigQueryAdaptor(Adaptor):
     support_add_column = True
     support_alter_column = True
@@ -27,6 +339,7 @@ class BigQueryAdaptor(Adaptor):
         "raw": [],
         "aged": [_age_field, _no_field, _op_field, _ts_field],
         "normal": [_seq_field, _no_field, _op_field],
+        "appended": [_age_field, _no_field, _op_field],
     }
 
     type_dict = {
@@ -53,7 +366,69 @@ class BigQueryAdaptor(Adaptor):
 
     delete_sql_template = "DELETE FROM {} WHERE {}"
 
-    def __init__(self, db: bigquery.Client, location: str = 'EU', log_dataset: str = "", **kwargs):
+    _escape_table = {ord(c): "_" for c in r"!@#$%^&*()[]{};:,./<>?\|`~-=+"}
+    # Type names returned by the table metadata API
+    _legacy_types = {"INTEGER": "INT64", "FLOAT": "FLOAT64", "BOOLEAN": "BOOL"}
+
+    ingestion_modes = ["stream", "load"]
+    load_compressions = ["", "GZIP"]
+    # Maximum partitions of an integer range partitioned table
+    range_partition_max = 4000
+    budget_actions = ["reject", "split"]
+    # merge: changes applied to the target table, append: changes appended, read through a deduplicated view
+    table_modes = ["merge", "append"]
+    # View of the current rows of an append mode table
+    view_suffix = "_current"
+    # _OP values of an insert, ranges holding nothing else could be loaded without merge
+    insert_ops = {"", "I"}
+    # Load the ranges which can't collide with the target by a plain insert
+    insert_fast_path = True
+    # Maximum distinct values per field of log value index
+    value_index_max = 10000
+    # Metadata cache settings
+    cache_size = 1024
+    cache_ttl = 600
+    # Source rows of append operations are converted in place
+    mutate_input = True
+
+    # Streaming insert request limits and concurrency
+    insert_max_rows = 10000
+    insert_max_bytes = 9 * 2 ** 20
+    # Request bytes per row besides its json: {"insertId": "<32 hex>", "json": ...}, separator
+    insert_row_overhead = 64
+    insert_workers = 4
+    # Chunks held in memory (queued or being sent): bounds the memory used by an iterable source
+    insert_max_inflight = 8
+    # Rows routed to a segment table at once by append_segment_data
+    route_batch_rows = 500
+    insert_max_retries = 3
+    insert_retry_delay = 0.5
+    # "stopped": valid row not inserted because of another invalid row of the same request
+    retryable_reasons = {"stopped", "backendError", "internalError", "timeout", "rateLimitExceeded"}
+
+    def __init__(self, db: 'bigquery.Client', location: str = 'EU', log_dataset: str = "",
+                 ingestion_mode: str = "stream", load_compression: str = "", staging_size: int = 2 ** 26,
+                 value_index: bool = False, index_dir: str = "", use_script: bool = False,
+                 script_transaction: bool = True, scan_budget: int = 0, budget_action: str = "reject", **kwargs):
+        """
+        Args:
+            db (:obj:`bigquery.Client`): Big Query Client
+            location (:obj:`str`): Location of created datasets
+            log_dataset (:obj:`str`): Dataset of log tables, same as target table if empty
+            ingestion_mode (:obj:`str`): ``stream`` (insert_rows_json) or ``load`` (load job from staged file)
+            load_compression (:obj:`str`): ``GZIP`` to compress the staged file of load jobs, empty for no compression
+            staging_size (:obj:`int`): Bytes of staged data kept in memory before spilling to a temporary file
+            value_index (:obj:`bool`): Track the partition / cluster values of the log tables created by this adaptor,
+                so that load_log_data could skip the discovery queries. All appends of these log tables must then
+                go through this adaptor.
+            index_dir (:obj:`str`): Directory of the persistent value index files, in memory only if empty
+            use_script (:obj:`bool`): load_log_data runs partition discovery, merge and log cleanup as one script job
+            script_transaction (:obj:`bool`): The merge and the log cleanup of the script are run in a transaction
+            scan_budget (:obj:`int`): Maximum bytes a merge of load_log_data may scan, checked by a dry run before
+                each merge. 0 means no check. Could be overridden per table by ``scan_budget`` of meta_data.
+            budget_action (:obj:`str`): ``reject`` to fail the over-budget loads, ``split`` to merge the age range
+                in smaller parts (a single age still over budget is rejected)
+        """
         super().__init__(**kwargs)
         if not isinstance(db, bigquery.Client):
             self.logger.error("connection must a big-query client", extra=self.log_context)
@@ -61,15 +436,66 @@ class BigQueryAdaptor(Adaptor):
         else:
             self.connection = db
         self.location = location
-        self.default_project = google.auth.default()[1]
+        self._default_project = None
         self.log_dataset = log_dataset
+        if ingestion_mode not in self.ingestion_modes:
+            self.logger.error("Ingestion mode {} not supported".format(ingestion_mode), extra=self.log_context)
+            raise ValueError("XIA-010006")
+        self.ingestion_mode = ingestion_mode
+        if load_compression.upper() not in self.load_compressions:
+            self.logger.error("Load compression {} not supported".format(load_compression), extra=self.log_context)
+            raise ValueError("XIA-010006")
+        self.load_compression = load_compression.upper()
+        self.staging_size = staging_size
+        self._row_encoders = _LRUCache(max_size=256)
+        self.value_index = value_index
+        self.index_dir = index_dir
+        self._value_indexes = dict()
+        self.use_script = use_script
+        self.script_transaction = script_transaction
+        if budget_action not in self.budget_actions:
+            self.logger.error("Budget action {} not supported".format(budget_action), extra=self.log_context)
+            raise ValueError("XIA-010008")
+        self.scan_budget = scan_budget
+        self.budget_action = budget_action
+        self._listeners = list()
+        # Metadata cache: known datasets, table objects (schema + etag) and resolved ids
+        self._dataset_cache = _LRUCache(max_size=self.cache_size, ttl=self.cache_ttl)
+        self._table_cache = _LRUCache(max_size=self.cache_size, ttl=self.cache_ttl)
+        self._id_cache = _LRUCache(max_size=self.cache_size * 4)
+        self._merge_skeletons = _LRUCache(max_size=self.cache_size)
+        # Rows appended and start time since the last compaction of each append mode table
+        self._compaction_state = dict()
+        # Loads submitted and not finished yet, per target table
+        self._pending_loads = Counter()
+        self._pending_loads_lock = threading.Lock()
+
+    @property
+    def default_project(self) -> str:
+        """Project of the ids without project part: the one of the client, else the one of default credentials
+
+        Resolved at first use, so that creating an adaptor never triggers any credential lookup.
+        """
+        if self._default_project is None:
+            project = getattr(self.connection, "project", None)
+            if not project:
+                import google.auth
+                project = google.auth.default()[1]
+            self._default_project = project
+        return self._default_project
+
+    @default_project.setter
+    def default_project(self, project: str):
+        self._default_project = project
+        # Ids resolved with the previous default project
+        self._id_cache.clear()
 
     def _escape_column_name(self, old_name: str) -> str:
         """A column name must contain only letters (a-z, A-Z), numbers (0-9), or underscores (_),
         and it must start with a letter or underscore. The maximum column name length is 128 characters.
         A column name cannot use any of the following prefixes: _TABLE_, _FILE_, _PARTITION
         """
-        better_name = old_name.translate({ord(c): "_" for c in r"!@#$%^&*()[]{};:,./<>?\|`~-=+"})
+        better_name = old_name.translate(self._escape_table)
         if better_name[0].isdigit():
             better_name = '_' + better_name
         if better_name.upper().startswith('_TABLE_') or \
@@ -104,33 +530,240 @@ class BigQueryAdaptor(Adaptor):
         return schema
 
     def _get_dataset_id(self, table_id) -> str:
-        table_path = table_id.split(".")
-        project_id = table_path[-3] if len(table_path) >= 3 and table_path[-3] else self.default_project
-        dataset_name = table_path[-2] if len(table_path) >= 2 and table_path[-2] else 'xia_default'
-        dataset_id = '.'.join([project_id, dataset_name])
+        dataset_id = self._id_cache.get(("dataset", table_id))
+        if dataset_id is None:
+            table_path = table_id.split(".")
+            project_id = table_path[-3] if len(table_path) >= 3 and table_path[-3] else self.default_project
+            dataset_name = table_path[-2] if len(table_path) >= 2 and table_path[-2] else 'xia_default'
+            dataset_id = '.'.join([project_id, dataset_name])
+            self._id_cache.set(("dataset", table_id), dataset_id)
         return dataset_id
 
     def _get_table_id(self, table_id, segment_id: str) -> str:
-        dataset_id = self._get_dataset_id(table_id)
-        table_name = table_id.split('.')[-1] + "_" + segment_id if segment_id else table_id.split('.')[-1]
-        bq_table_id = '.'.join([dataset_id, table_name])
+        bq_table_id = self._id_cache.get(("table", table_id, segment_id))
+        if bq_table_id is None:
+            dataset_id = self._get_dataset_id(table_id)
+            table_name = table_id.split('.')[-1] + "_" + segment_id if segment_id else table_id.split('.')[-1]
+            bq_table_id = '.'.join([dataset_id, table_name])
+            self._id_cache.set(("table", table_id, segment_id), bq_table_id)
         return bq_table_id
 
-    def _get_time_partition_condition(self, table_id: str, dt_type: str, field_name: str, start_age, end_age) -> str:
-        dt_type = "DAY" if dt_type.upper() == "hour" else dt_type.upper()
-        get_partition_sql_template = ( "SELECT DISTINCT(DATE_TRUNC(DATE({}), {})) "
-                                       "FROM {} WHERE _AGE >= {} AND _AGE <= {} ")
-        get_partition_sql = get_partition_sql_template.format(
-            self._sql_safe(field_name),
-            self._sql_safe(dt_type),
-            self._get_table_id(table_id, ""), # This function works only with log table
-            start_age,
-            end_age
+    def _get_table(self, bq_table_id: str):
+        """Table object (schema and etag) from metadata cache, fetched from Big Query at cache miss"""
+        table = self._table_cache.get(bq_table_id)
+        if table is None:
+            table = self._call_api("get_table", bq_table_id, bq_table_id)
+            self._table_cache.set(bq_table_id, table)
+        return table
+
+    def clear_cache(self):
+        """Forget all cached datasets, tables, ids and merge statements"""
+        self._dataset_cache.clear()
+        self._table_cache.clear()
+        self._id_cache.clear()
+        self._merge_skeletons.clear()
+
+    # ===Instrumentation=========
+    def add_listener(self, callback):
+        """Register a metrics sink, called with a dictionary for each insert chunk, load job, query job or ddl call
+
+        Event keys: ``type``, ``operation``, ``table_id``, ``timestamp``, ``duration`` (seconds) and, depending
+        on the type, ``method``, ``kind``, ``rows``, ``bytes``, ``attempt``, ``error``, ``job`` (job statistics)
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+    @contextmanager
+    def track(self, name: str):
+        """Context manager aggregating the events of the enclosed calls, including those of worker threads
+
+        Examples:
+            >>> with adaptor.track("load cycle") as stats:
+            ...     adaptor.load_log_data(log_table_id, table_id, field_data, meta_data, 2, 102)
+            >>> stats.summary()["slot_millis"]
+        """
+        stats = OperationStats(name)
+        token = _active_operations.set(_active_operations.get() + (stats, ))
+        try:
+            yield stats
+        finally:
+            stats.close()
+            _active_operations.reset(token)
+
+    def _emit(self, event_type: str, table_id: str, start_time: float, **details):
+        operations = _active_operations.get()
+        if not self._listeners and not operations:
+            return
+        event = {"type": event_type, "operation": operations[-1].name if operations else "", "table_id": table_id,
+                 "timestamp": time.time(), "duration": time.monotonic() - start_time}
+        event.update(details)
+        for operation in operations:
+            operation.add(event)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:  # pragma: no cover
+                self.logger.warning("Metrics listener error: {}".format(e), extra=self.log_context)
+
+    def _get_job_stats(self, job) -> dict:
+        # Query jobs and load jobs don't carry the same statistics
+        stats = {"job_id": job.job_id}
+        for key in ["statement_type", "total_bytes_processed", "total_bytes_billed", "slot_millis",
+                    "num_dml_affected_rows", "cache_hit", "output_rows", "input_file_bytes", "output_bytes"]:
+            stats[key] = getattr(job, key, None)
+        return stats
+
+    def _run_query(self, sql: str, table_id: str, kind: str, job_config=None):
+        """Run a query job until its end, returns the job and its result rows"""
+        start_time = time.monotonic()
+        try:
+            job = self.connection.query(sql, job_config=job_config)
+            rows = job.result()
+        except Exception as e:
+            self._emit("query", table_id, start_time, kind=kind, error=str(e))
+            raise
+        self._emit("query", table_id, start_time, kind=kind, job=self._get_job_stats(job))
+        return job, rows
+
+    def _call_api(self, method: str, table_id: str, *args, **kwargs):
+        """Call a control-plane method of the client"""
+        start_time = time.monotonic()
+        try:
+            result = getattr(self.connection, method)(*args, **kwargs)
+        except Exception as e:
+            self._emit("ddl", table_id, start_time, method=method, error=str(e))
+            raise
+        self._emit("ddl", table_id, start_time, method=method)
+        return result
+
+    def _dry_run(self, sql: str, table_id: str) -> int:
+        """Bytes the given statement would process"""
+        start_time = time.monotonic()
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        try:
+            job = self.connection.query(sql, job_config=job_config)
+        except Exception as e:
+            self._emit("query", table_id, start_time, kind="dry_run", error=str(e))
+            raise
+        self._emit("query", table_id, start_time, kind="dry_run", job=self._get_job_stats(job))
+        return job.total_bytes_processed or 0
+
+    def _get_index_path(self, bq_log_table_id: str) -> str:
+        return os.path.join(self.index_dir, bq_log_table_id + ".json")
+
+    def _create_value_index(self, bq_log_table_id: str, field_data: List[dict]):
+        time_fields = [field['field_name'] for field in field_data
+                       if self._get_field_type(field['type_chain']) in ['DATE', 'DATETIME']]
+        key_fields = [field['field_name'] for field in field_data if field['key_flag'] and "char" in field['type_chain']]
+        fields = {field_name: self._escape_column_name(field_name) for field_name in time_fields + key_fields}
+        # Operations of the ranges are tracked as well, for the insert-only fast path
+        fields["_OP"] = "_OP"
+        self._value_indexes[bq_log_table_id] = _LogValueIndex(fields, time_fields, self.value_index_max)
+        self._save_value_index(bq_log_table_id)
+
+    def _get_value_index(self, bq_log_table_id: str) -> Union[_LogValueIndex, None]:
+        if not self.value_index:
+            return None
+        index = self._value_indexes.get(bq_log_table_id, None)
+        if index is None and self.index_dir and os.path.exists(self._get_index_path(bq_log_table_id)):
+            with open(self._get_index_path(bq_log_table_id), encoding="utf-8") as fp:
+                index = self._value_indexes[bq_log_table_id] = _LogValueIndex.from_dict(json.load(fp))
+        return index
+
+    def _save_value_index(self, bq_log_table_id: str):
+        index = self._value_indexes.get(bq_log_table_id, None)
+        if index is None or not self.index_dir:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        temp_path = self._get_index_path(bq_log_table_id) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as fp:
+            json.dump(index.to_dict(), fp)
+        os.replace(temp_path, self._get_index_path(bq_log_table_id))
+
+    def _drop_value_index(self, bq_log_table_id: str):
+        self._value_indexes.pop(bq_log_table_id, None)
+        if self.index_dir and os.path.exists(self._get_index_path(bq_log_table_id)):
+            os.remove(self._get_index_path(bq_log_table_id))
+
+    def _get_log_values(self, table_id: str, field_name: str, start_age, end_age) -> Union[set, None]:
+        index = self._get_value_index(self._get_table_id(table_id, ""))
+        return index.get_values(field_name, start_age, end_age) if index is not None else None
+
+    def _sql_literal(self, value) -> str:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+    def _get_segment_bounds(self, segment_config: dict):
+        """Lowest and highest values of an integer segment, None if the segment has no finite integer bounds"""
+        if "int" not in segment_config.get("type_chain", []):
+            return None
+        if segment_config.get("list"):
+            return min(segment_config["list"]), max(segment_config["list"])
+        elif segment_config.get("min", None) is not None and segment_config.get("max", None) is not None:
+            return segment_config["min"], segment_config["max"]
+        return None
+
+    def _get_range_partitioning(self, field_name: str, start: int, end: int, interval: int = 0):
+        """Integer range partitioning of [start, end), interval chosen to stay under the partition limit"""
+        if not interval:
+            interval = max(1, -(-(end - start) // self.range_partition_max))
+        return bigquery.RangePartitioning(
+            range_=bigquery.PartitionRange(start=start, end=end, interval=interval),
+            field=field_name,
         )
-        job = self.connection.query(get_partition_sql)
-        values = [row.values()[0] for row in job.result()]
-        null_flag = True if None in values else False
-        values = ["'" + value.strftime("%Y-%m-%d") + "'" for value in values if value is not None]
+
+    def _get_segment_condition(self, meta_data: dict) -> str:
+        """Predicate on the target table given by the segment definition, empty if the segment has none"""
+        segment_config = meta_data.get("segment", {})
+        field_name = segment_config.get("field_name", "")
+        if not field_name:
+            return ""
+        if segment_config.get("list"):
+            return "origin." + field_name + " IN (" + \
+                ", ".join(self._sql_literal(value) for value in segment_config["list"]) + ")"
+        elif segment_config.get("min", None) is not None and segment_config.get("max", None) is not None:
+            return "origin." + field_name + " BETWEEN " + self._sql_literal(segment_config["min"]) + \
+                " AND " + self._sql_literal(segment_config["max"])
+        elif segment_config.get("default", None) is not None:
+            return "origin." + field_name + " = " + self._sql_literal(segment_config["default"])
+        elif segment_config.get("null", False):
+            return "origin." + field_name + " IS NULL"
+        return ""
+
+    def _add_segment_condition(self, meta_data: dict, partition_condition: str) -> str:
+        segment_condition = self._get_segment_condition(meta_data)
+        if not segment_condition:
+            return partition_condition
+        elif partition_condition == "1 = 1":
+            return segment_condition
+        return "(" + segment_condition + " AND " + partition_condition + ")"
+
+    def _get_time_partition_condition(self, table_id: str, dt_type: str, field_name: str, start_age, end_age) -> str:
+        dt_type = "DAY" if dt_type.upper() == "HOUR" else dt_type.upper()
+        index_values = self._get_log_values(table_id, field_name, start_age, end_age)
+        if index_values is not None and dt_type in ["DAY", "MONTH", "YEAR"]:
+            trunc_size = {"DAY": 10, "MONTH": 7, "YEAR": 4}[dt_type]
+            values = {value[:trunc_size] + "-01-01"[:10 - trunc_size] if value is not None else None
+                      for value in index_values}
+            null_flag = True if None in values else False
+            values = ["'" + value + "'" for value in sorted(value for value in values if value is not None)]
+        else:
+            get_partition_sql_template = ( "SELECT DISTINCT(DATE_TRUNC(DATE({}), {})) "
+                                           "FROM {} WHERE _AGE >= {} AND _AGE <= {} ")
+            get_partition_sql = get_partition_sql_template.format(
+                self._sql_safe(field_name),
+                self._sql_safe(dt_type),
+                self._get_table_id(table_id, ""), # This function works only with log table
+                start_age,
+                end_age
+            )
+            job, rows = self._run_query(get_partition_sql, self._get_table_id(table_id, ""), "discovery")
+            values = [row.values()[0] for row in rows]
+            null_flag = True if None in values else False
+            values = ["'" + value.strftime("%Y-%m-%d") + "'" for value in values if value is not None]
         field_dt = "DATE_TRUNC(DATE(origin." + field_name + "), {})".format(dt_type)
         filter = field_dt + " IN (" + ", ".join(values) + ")" if values else "1 = 0"
         if null_flag:
@@ -140,18 +773,20 @@ class BigQueryAdaptor(Adaptor):
         return result_sql
 
     def _get_std_partition_condition(self, table_id: str, field_name: str, start_age, end_age) -> str:
-        get_partition_sql_template = ( "SELECT DISTINCT({}) "
-                                       "FROM {} WHERE _AGE >= {} AND _AGE <= {} ")
-        get_partition_sql = get_partition_sql_template.format(
-            self._sql_safe(field_name),
-            self._get_table_id(table_id, ""), # This function works only with log table
-            start_age,
-            end_age
-        )
-        job = self.connection.query(get_partition_sql)
-        values = [row.values()[0] for row in job.result()]
+        values = self._get_log_values(table_id, field_name, start_age, end_age)
+        if values is None:
+            get_partition_sql_template = ( "SELECT DISTINCT({}) "
+                                           "FROM {} WHERE _AGE >= {} AND _AGE <= {} ")
+            get_partition_sql = get_partition_sql_template.format(
+                self._sql_safe(field_name),
+                self._get_table_id(table_id, ""), # This function works only with log table
+                start_age,
+                end_age
+            )
+            job, rows = self._run_query(get_partition_sql, self._get_table_id(table_id, ""), "discovery")
+            values = [row.values()[0] for row in rows]
         null_flag = True if None in values else False
-        values = ["'" + value + "'" for value in values if value is not None]
+        values = [self._sql_literal(value) for value in sorted(value for value in values if value is not None)]
         filter = "origin." + field_name + " IN (" + ", ".join(values) + ")" if values else "1 = 0"
         if null_flag:
             result_sql = "(" + filter + " OR " + "origin." + field_name + " IS NULL)"  # pragma: no cover
@@ -159,28 +794,20 @@ class BigQueryAdaptor(Adaptor):
             result_sql = filter
         return result_sql
 
-    def _get_load_log_sql(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
-                          start_age: int, end_age: int) -> str:
-        # Variable Name: @table_name@, @log_table_name@, @start_age@, @end_age@,
-        #                @partition@, @clustering@, @on_key_eq_key@
-        #                @field_list, @field_list, @upd_field_eq_field@
-        load_log_sql_template = (
-            "MERGE INTO {} AS origin "
-            "USING ( SELECT * EXCEPT(_AGE, _NO) FROM ( "
-            "SELECT *, ROW_NUMBER() OVER (PARTITION BY id ORDER BY _AGE DESC, _NO DESC) AS row_nb "
-            "FROM {} WHERE _AGE >= {} AND _AGE <= {}) "
-            "WHERE row_nb = 1 ) AS log_table \n"
-            "ON {} \n"
-            "AND {} \n"
-            "AND {} \n"
-            "WHEN NOT MATCHED AND _OP != 'D' THEN INSERT ({}) VALUES ({}) \n"
-            "WHEN MATCHED AND _OP = 'D' THEN DELETE \n"
-            "WHEN MATCHED AND _OP != 'D' THEN UPDATE SET {} "
-        )
-        segment_id = meta_data.get("segment", {}).get("id", "")
+    def _get_prune_fields(self, field_data: list, meta_data: dict):
+        """Partition field, its configuration and cluster field used to prune the target table of a merge"""
         partition_conf = meta_data.get("partition", {})
         partition_field = list(partition_conf)[0] if partition_conf else ""
         partition_conf = partition_conf[partition_field] if partition_field else {}
+        # One level cluster limit should be sufficient
+        key_list = [field["field_name"] for field in field_data if field['key_flag'] and "char" in field['type_chain']]
+        cluster_list = [field for field in list(meta_data.get("cluster", {})) if field in key_list]
+        cluster_field = cluster_list[0] if cluster_list else ""
+        return partition_field, partition_conf, cluster_field
+
+    def _get_load_log_sql(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                          start_age: int, end_age: int, update_fields: list = None) -> str:
+        partition_field, partition_conf, cluster_field = self._get_prune_fields(field_data, meta_data)
         partition_type = partition_conf.get("type", "")
         if partition_type == "time":
             partition_condition = self._get_time_partition_condition(log_table_id, partition_conf["criteria"],
@@ -189,39 +816,231 @@ class BigQueryAdaptor(Adaptor):
             partition_condition = self._get_std_partition_condition(log_table_id, partition_field, start_age, end_age)
         else:  # pragma: no cover
             partition_condition = "1 = 1"
+        # Segment bounds are known without discovery, they are valid for all the rows of the target table
+        partition_condition = self._add_segment_condition(meta_data, partition_condition)
 
-        # One level cluster limit should be sufficient
-        key_list = [field["field_name"] for field in field_data if field['key_flag'] and "char" in field['type_chain']]
-        cluster_list = [field for field in list(meta_data.get("cluster", {})) if field in key_list]
-        cluster_field = cluster_list[0] if cluster_list else ""
         if cluster_field:
             cluster_condition = self._get_std_partition_condition(log_table_id, cluster_field, start_age, end_age)
         else:
             cluster_condition = "1 = 1"
 
-        on_key_eq_key = ' AND '.join(["origin." + field['field_name'] + ' = ' +
-                                      "log_table." + field['field_name']
-                                      for field in field_data if field['key_flag']])
+        return self._get_merge_sql(log_table_id, table_id, field_data, meta_data, start_age, end_age,
+                                   partition_condition, cluster_condition, update_fields)
 
-        all_fields = ", ".join([field['field_name'] for field in field_data])
+    def _get_merge_skeleton(self, table_id: str, field_data: list, meta_data: dict, update_fields: list = None) -> str:
+        """Merge statement of a target table and schema, with placeholders for the per-call parts
 
-        upd_field_eq_field = ', '.join([field['field_name'] + ' = ' + "log_table." + field['field_name']
-                                        for field in field_data if not field['key_flag']])
+        Placeholders: {log_table_id}, {start_age}, {end_age}, {partition_condition}, {cluster_condition}
+        """
+        segment_id = meta_data.get("segment", {}).get("id", "")
+        skeleton_key = (self._get_table_id(table_id, segment_id),
+                        json.dumps(field_data, sort_keys=True, default=str),
+                        tuple(update_fields) if update_fields is not None else None)
+        skeleton = self._merge_skeletons.get(skeleton_key)
+        if skeleton is not None:
+            return skeleton
 
-        load_log_sql = load_log_sql_template.format(
-            self._get_table_id(table_id, segment_id),
-            self._get_table_id(log_table_id, ""),
-            start_age,
-            end_age,
-            self._sql_safe(partition_condition),
-            self._sql_safe(cluster_condition),
-            self._sql_safe(on_key_eq_key),
-            self._sql_safe(all_fields),
-            self._sql_safe(all_fields),
-            self._sql_safe(upd_field_eq_field),
+        names = {field['field_name']: self._escape_column_name(field['field_name']) for field in field_data}
+        key_list = [names[field['field_name']] for field in field_data if field['key_flag']]
+        update_list = [names[field['field_name']] for field in field_data if not field['key_flag'] and
+                       (update_fields is None or field['field_name'] in update_fields)]
+        # Latest operation of each key within the age range
+        dedup_sql = ("SELECT * EXCEPT(_AGE, _NO) FROM {{log_table_id}} "
+                     "WHERE _AGE >= {{start_age}} AND _AGE <= {{end_age}} "
+                     "QUALIFY ROW_NUMBER() OVER (PARTITION BY {} ORDER BY _AGE DESC, _NO DESC) = 1").format(
+            ", ".join(key_list))
+        on_key_eq_key = " AND ".join(["origin." + name + " = log_table." + name for name in key_list])
+        all_fields = ", ".join(names.values())
+        statements = [
+            "MERGE INTO {} AS origin ".format(self._get_table_id(table_id, segment_id)),
+            "USING ( {} ) AS log_table \n".format(dedup_sql),
+            "ON {partition_condition} \n",
+            "AND {cluster_condition} \n",
+            "AND {} \n".format(on_key_eq_key),
+            "WHEN NOT MATCHED AND _OP != 'D' THEN INSERT ({}) VALUES ({}) \n".format(all_fields, all_fields),
+            "WHEN MATCHED AND _OP = 'D' THEN DELETE \n",
+        ]
+        if update_list:
+            statements.append("WHEN MATCHED AND _OP != 'D' THEN UPDATE SET {} ".format(
+                ", ".join([name + " = log_table." + name for name in update_list])))
+        skeleton = self._sql_safe("".join(statements))
+        self._merge_skeletons.set(skeleton_key, skeleton)
+        return skeleton
+
+    def _get_merge_sql(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                       start_age: int, end_age: int, partition_condition: str, cluster_condition: str,
+                       update_fields: list = None) -> str:
+        """
+        Args:
+            update_fields (:obj:`list`): Non-key fields carried by the change set, only they are updated by
+                the merge (all non-key fields if None)
+        """
+        return self._get_merge_skeleton(table_id, field_data, meta_data, update_fields).format(
+            log_table_id=self._get_table_id(log_table_id, ""),
+            start_age=int(start_age),
+            end_age=int(end_age),
+            partition_condition=self._sql_safe(partition_condition),
+            cluster_condition=self._sql_safe(cluster_condition),
         )
 
-        return load_log_sql
+    def _get_insert_log_sql(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                            start_age: int, end_age: int) -> str:
+        """Insert of the latest operation of each key, the merge result when no key is in the target table"""
+        names = [self._escape_column_name(field['field_name']) for field in field_data]
+        key_list = [self._escape_column_name(field['field_name']) for field in field_data if field['key_flag']]
+        insert_sql = ("INSERT INTO {} ({}) SELECT {} FROM {} WHERE _AGE >= {} AND _AGE <= {} "
+                      "QUALIFY ROW_NUMBER() OVER (PARTITION BY {} ORDER BY _AGE DESC, _NO DESC) = 1 "
+                      "AND _OP != 'D'").format(
+            self._get_table_id(table_id, meta_data.get("segment", {}).get("id", "")), ", ".join(names),
+            ", ".join(names), self._get_table_id(log_table_id, ""), int(start_age), int(end_age),
+            ", ".join(key_list))
+        return self._sql_safe(insert_sql)
+
+    def _is_empty_table(self, bq_table_id: str) -> bool:
+        table = self._table_cache.get(bq_table_id)
+        # Cached row count is only trusted when positive: the merge fallback is always correct
+        if table is not None and table.num_rows:
+            return False
+        table = self._call_api("get_table", bq_table_id, bq_table_id)
+        self._table_cache.set(bq_table_id, table)
+        return not table.num_rows and table.streaming_buffer is None
+
+    def _is_insert_only(self, log_table_id: str, table_id: str, meta_data: dict, start_age: int, end_age: int) -> bool:
+        """The age range could be loaded by a plain insert, without merge
+
+        It is the case when no key of the range could be found in the target table: the target table is empty,
+        or it is declared ``append_only`` by meta_data and the range holds inserts only. The operations are given
+        by the value index, or by one query on the age range of the log table.
+        """
+        if not self.insert_fast_path:
+            return False
+        bq_table_id = self._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        try:
+            if self._is_empty_table(bq_table_id):
+                return True
+            if not meta_data.get("append_only", False):
+                return False
+            ops = self._get_log_values(log_table_id, "_OP", start_age, end_age)
+            if ops is None:
+                ops_sql = "SELECT DISTINCT(_OP) AS v FROM {} WHERE _AGE >= {} AND _AGE <= {}".format(
+                    self._get_table_id(log_table_id, ""), int(start_age), int(end_age))
+                job, rows = self._run_query(ops_sql, self._get_table_id(log_table_id, ""), "insert_check")
+                ops = {row.values()[0] for row in rows}
+        except Exception as e:  # pragma: no cover
+            self.logger.warning("Insert-only check of {} failed: {}".format(table_id, e),
+                                extra=self.log_context)  # pragma: no cover
+            return False  # pragma: no cover
+        return ops <= self.insert_ops
+
+    def _get_filter_script_expr(self, values_sql: str, filter_left: str, field_name: str, value_format: str) -> str:
+        """Scripting expression computing a pruning predicate from the distinct values returned by values_sql"""
+        return ("(SELECT CONCAT('(', IF(COUNT(v) = 0, '1 = 0', "
+                "CONCAT('{} IN (', STRING_AGG(FORMAT(\"{}\", v), ', '), ')')), "
+                "IF(COUNTIF(v IS NULL) > 0, ' OR origin.{} IS NULL', ''), ')') "
+                "FROM ({}))").format(filter_left, value_format, field_name, values_sql)
+
+    def _get_load_log_script(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                             start_age: int, end_age: int, remove_old_log: bool = True,
+                             update_fields: list = None) -> str:
+        """One multi-statement job: pruning values discovery, merge by dynamic SQL and old log cleanup
+
+        Pruning predicates already known by the value index are directly inlined.
+        """
+        bq_log_table_id = self._get_table_id(log_table_id, "")
+        partition_field, partition_conf, cluster_field = self._get_prune_fields(field_data, meta_data)
+        partition_type = partition_conf.get("type", "")
+        values_sql_template = "SELECT DISTINCT({}) AS v FROM {} WHERE _AGE >= {} AND _AGE <= {}"
+        declares = []
+
+        def get_std_condition(field_name: str, variable: str) -> str:
+            if self._get_log_values(log_table_id, field_name, start_age, end_age) is not None:
+                return self._get_std_partition_condition(log_table_id, field_name, start_age, end_age)
+            values_sql = values_sql_template.format(field_name, bq_log_table_id, start_age, end_age)
+            declares.append((variable, self._get_filter_script_expr(values_sql, "origin." + field_name,
+                                                                    field_name, "%T")))
+            return "@@{}@@".format(variable)
+
+        if partition_type == "time":
+            dt_type = "DAY" if partition_conf["criteria"].upper() == "HOUR" else partition_conf["criteria"].upper()
+            if self._get_log_values(log_table_id, partition_field, start_age, end_age) is not None:
+                partition_condition = self._get_time_partition_condition(log_table_id, partition_conf["criteria"],
+                                                                         partition_field, start_age, end_age)
+            else:
+                values_sql = values_sql_template.format("DATE_TRUNC(DATE({}), {})".format(partition_field, dt_type),
+                                                        bq_log_table_id, start_age, end_age)
+                field_dt = "DATE_TRUNC(DATE(origin." + partition_field + "), {})".format(dt_type)
+                declares.append(("partition_filter",
+                                 self._get_filter_script_expr(values_sql, field_dt, partition_field, "'%t'")))
+                partition_condition = "@@partition_filter@@"
+        elif partition_type:  # pragma: no cover
+            partition_condition = get_std_condition(partition_field, "partition_filter")
+        else:  # pragma: no cover
+            partition_condition = "1 = 1"
+        partition_condition = self._add_segment_condition(meta_data, partition_condition)
+        cluster_condition = get_std_condition(cluster_field, "cluster_filter") if cluster_field else "1 = 1"
+
+        # Static text must survive FORMAT(), dynamic predicates are given as arguments in order of appearance
+        merge_sql = self._get_merge_sql(log_table_id, table_id, field_data, meta_data, start_age, end_age,
+                                        partition_condition, cluster_condition, update_fields).replace('%', '%%')
+        for variable, expr in declares:
+            merge_sql = merge_sql.replace("@@{}@@".format(variable), "%s")
+        if '"""' in merge_sql:  # pragma: no cover
+            self.logger.error("Merge statement could not be scripted", extra=self.log_context)
+            raise ValueError("XIA-010007")
+
+        statements = ["DECLARE {} STRING DEFAULT {};".format(variable, expr) for variable, expr in declares]
+        body = ['EXECUTE IMMEDIATE FORMAT(r"""{}"""{});'.format(merge_sql,
+                                                                 "".join(", " + var for var, expr in declares))]
+        if remove_old_log:
+            body.append(self._get_remove_old_log_sql(log_table_id, end_age) + ";")
+        if self.script_transaction:
+            body = self._get_transaction_body(body)
+        return "\n".join(statements + body)
+
+    def _get_transaction_body(self, body: List[str]) -> List[str]:
+        """Statements of body run in one transaction, rolled back at the first error"""
+        return ["BEGIN", "BEGIN TRANSACTION;"] + body + ["COMMIT TRANSACTION;",
+                                                          "EXCEPTION WHEN ERROR THEN",
+                                                          "ROLLBACK TRANSACTION;",
+                                                          "RAISE USING MESSAGE = @@error.message;",
+                                                          "END;"]
+
+    def _get_table_mode(self, meta_data: dict) -> str:
+        table_mode = meta_data.get("table_mode", "merge")
+        if table_mode not in self.table_modes:
+            self.logger.error("Table mode {} not supported".format(table_mode), extra=self.log_context)
+            raise ValueError("XIA-010009")
+        return table_mode
+
+    def get_view_id(self, table_id: str, segment_id: str) -> str:
+        """Id of the view giving the current rows of an append mode table"""
+        return self._get_table_id(table_id, segment_id) + self.view_suffix
+
+    def _get_current_sql(self, bq_table_id: str, field_data: list) -> str:
+        """Latest non-deleted row of each key of an append mode table, with its _AGE, _NO and _OP"""
+        key_list = [self._escape_column_name(field['field_name']) for field in field_data if field['key_flag']]
+        return self._sql_safe("SELECT * FROM {} WHERE TRUE "
+                              "QUALIFY ROW_NUMBER() OVER (PARTITION BY {} ORDER BY _AGE DESC, _NO DESC) = 1 "
+                              "AND _OP != 'D'".format(bq_table_id, ", ".join(key_list)))
+
+    def _get_append_log_sql(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                            start_age: int, end_age: int) -> str:
+        """Operations of the age range appended as they are to an append mode table"""
+        names = ", ".join([self._escape_column_name(field['field_name']) for field in field_data] +
+                          ["_AGE", "_NO", "_OP"])
+        return self._sql_safe("INSERT INTO {} ({}) SELECT {} FROM {} WHERE _AGE >= {} AND _AGE <= {}".format(
+            self._get_table_id(table_id, meta_data.get("segment", {}).get("id", "")), names, names,
+            self._get_table_id(log_table_id, ""), int(start_age), int(end_age)))
+
+    def _get_compact_script(self, bq_table_id: str, field_data: list) -> str:
+        """Rewrite of an append mode table keeping only its current rows
+
+        The rewrite is transactional: a concurrent append makes one of the two jobs fail instead of being lost.
+        """
+        body = ["CREATE TEMP TABLE _compacted AS {};".format(self._get_current_sql(bq_table_id, field_data)),
+                "DELETE FROM {} WHERE TRUE;".format(bq_table_id),
+                "INSERT INTO {} SELECT * FROM _compacted;".format(bq_table_id)]
+        return "\n".join(self._get_transaction_body(body))
 
     def _get_remove_old_log_sql(self, log_table_id: str, end_age: int):
         old_age_condition = "_AGE <= {}".format(end_age)
@@ -242,89 +1061,598 @@ class BigQueryAdaptor(Adaptor):
         log_table_id = '.'.join([project_id, dataset_name, table_name + suffix])
         return log_table_id
 
-    def append_log_data(self, table_id: str, field_data: List[dict], data: List[dict], **kwargs):
-        conv_func_dict = self.get_dt_conv_func_dict(field_data)
-        for i in range(((len(data) - 1) // 10000) + 1):
-            start, end = i * 10000, (i + 1) * 10000
-            load_data = []
-            for line in data[start: end]:
-                line["_DT"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-                for field in [k for k in line if k in conv_func_dict]:
-                    line[field] = conv_func_dict[field](line[field])
-                load_data.append({self._escape_column_name(k): v for k, v in line.items()})
+    def _get_row_encoder(self, field_data: List[dict]) -> _RowEncoder:
+        encoder_key = json.dumps(field_data, sort_keys=True, default=str)
+        encoder = self._row_encoders.get(encoder_key)
+        if encoder is None:
+            encoder = _RowEncoder(self, field_data)
+            self._row_encoders.set(encoder_key, encoder)
+        return encoder
+
+    def _chunk_rows(self, rows):
+        """Cut rows into request-sized chunks, limited by both row count and serialized bytes"""
+        chunk, chunk_size = [], 0
+        for row in rows:
+            # Serialized as in the request: non-ascii characters are sent as \uXXXX escapes
+            row_size = len(json.dumps(row).encode("utf-8")) + self.insert_row_overhead
+            if chunk and (len(chunk) >= self.insert_max_rows or chunk_size + row_size > self.insert_max_bytes):
+                yield chunk, chunk_size
+                chunk, chunk_size = [], 0
+            chunk.append(row)
+            chunk_size += row_size
+        if chunk:
+            yield chunk, chunk_size
+
+    def _insert_chunk(self, table_id: str, bq_table_id: str, chunk: List[dict], chunk_size: int) -> InsertResult:
+        """Insert one chunk, only the rows reported as retryable are sent again (with exponential backoff)"""
+        result = InsertResult()
+        row_ids = [uuid.uuid4().hex for _ in chunk]  # Same insert ids at each retry for best-effort dedup
+        pending = list(range(len(chunk)))
+        for attempt in range(self.insert_max_retries + 1):
+            if attempt > 0:
+                result.retried += len(pending)
+                time.sleep(self.insert_retry_delay * 2 ** (attempt - 1))
+            start_time = time.monotonic()
             try:
-                errors = self.connection.insert_rows_json(self._get_table_id(table_id, ""), load_data)
-            except BadRequest as e:  # pragma: no cover
-                return False  # pragma: no cover
-            if errors == []:
+                errors = self.connection.insert_rows_json(bq_table_id,
+                                                          [chunk[i] for i in pending],
+                                                          row_ids=[row_ids[i] for i in pending])
+            # Transport errors (connection reset, timeout) are OSError, requests exceptions included
+            except (exceptions.ServerError, exceptions.TooManyRequests, OSError) as e:  # pragma: no cover
+                self._emit("insert_chunk", bq_table_id, start_time, rows=len(pending), attempt=attempt,
+                           bytes=chunk_size * len(pending) // len(chunk), error=str(e))
+                self.logger.warning("Insert {} will be retried: {}".format(table_id, e), extra=self.log_context)
                 continue
-            else:  # pragma: no cover
-                self.logger.error("Insert {} Error: {}".format(table_id, errors), extra=self.log_context)
-                return False
-        return True
+            except exceptions.GoogleAPICallError as e:
+                self._emit("insert_chunk", bq_table_id, start_time, rows=len(pending), attempt=attempt,
+                           bytes=chunk_size * len(pending) // len(chunk), error=str(e))
+                self.logger.error("Insert {} Error: {}".format(table_id, e), extra=self.log_context)
+                result.failed += len(pending)
+                result.errors.append(str(e))
+                return result
+            self._emit("insert_chunk", bq_table_id, start_time, rows=len(pending), attempt=attempt,
+                       bytes=chunk_size * len(pending) // len(chunk), failed_rows=len(errors))
+            retry_list, error_list = [], []
+            for error in errors:
+                reasons = {line.get("reason", "") for line in error.get("errors", [])}
+                if reasons and reasons <= self.retryable_reasons:
+                    retry_list.append(pending[error["index"]])
+                else:
+                    error_list.append(error)
+            result.success += len(pending) - len(retry_list) - len(error_list)
+            if error_list:
+                self.logger.error("Insert {} Error: {}".format(table_id, error_list), extra=self.log_context)
+                result.failed += len(error_list)
+                result.errors.extend(error_list)
+            pending = retry_list
+            if not pending:
+                return result
+        self.logger.error("Insert {} Error: {} rows still failed after {} retries".format(  # pragma: no cover
+            table_id, len(pending), self.insert_max_retries), extra=self.log_context)
+        result.failed += len(pending)  # pragma: no cover
+        return result  # pragma: no cover
 
-    def load_log_data(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
-                      start_age: int, end_age: int):
+    def _stream_rows(self, table_id: str, bq_table_id: str, rows) -> InsertResult:
+        result = InsertResult()
+        with ThreadPoolExecutor(max_workers=self.insert_workers) as executor:
+            futures = set()
+            for chunk, chunk_size in self._chunk_rows(rows):
+                # Bounded number of chunks in flight: the row source is consumed at the insert rate
+                if len(futures) >= self.insert_max_inflight:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result += future.result()
+                futures.add(executor.submit(contextvars.copy_context().run,
+                                            self._insert_chunk, table_id, bq_table_id, chunk, chunk_size))
+            for future in futures:
+                result += future.result()
+        return result
+
+    def _load_rows(self, table_id: str, bq_table_id: str, rows) -> InsertResult:
+        """Stage the rows as newline-delimited json and submit them as one load job
+
+        Load jobs are free, have no streaming buffer and accept much bigger payloads than streaming inserts.
+        The staging buffer stays in memory up to ``staging_size`` bytes and then spills to a temporary file.
         """
-        Warning:
-            To make the transactional-like update, the time-partition field of original table must contain fixed value.
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        with tempfile.SpooledTemporaryFile(max_size=self.staging_size) as staging:
+            if self.load_compression == "GZIP":
+                job_config.compression = "GZIP"
+                writer = gzip.GzipFile(fileobj=staging, mode="wb", compresslevel=1)
+            else:
+                writer = staging
+            row_count = 0
+            for row in rows:
+                writer.write(json.dumps(row, ensure_ascii=False).encode())
+                writer.write(b"\n")
+                row_count += 1
+            if writer is not staging:
+                writer.close()
+            if row_count == 0:
+                return InsertResult()
+            staging.seek(0)
+            start_time = datetime.now()
+            monotonic_start = time.monotonic()
+            try:
+                job = self.connection.load_table_from_file(staging, bq_table_id, rewind=True, job_config=job_config)
+                job.result()
+            except (exceptions.GoogleAPICallError, OSError) as e:  # pragma: no cover
+                self._emit("load_job", bq_table_id, monotonic_start, rows=row_count, error=str(e))
+                self.logger.error("Load {} Error: {}".format(table_id, e), extra=self.log_context)
+                return InsertResult(failed=row_count, errors=[str(e)])
+            self._emit("load_job", bq_table_id, monotonic_start, rows=row_count, bytes=job.input_file_bytes,
+                       job=self._get_job_stats(job))
+        load_stats = {
+            "job_id": job.job_id,
+            "table_id": bq_table_id,
+            "input_rows": row_count,
+            "output_rows": job.output_rows,
+            "input_file_bytes": job.input_file_bytes,
+            "output_bytes": job.output_bytes,
+            "duration": (datetime.now() - start_time).total_seconds(),
+        }
+        if job.output_rows is not None and job.output_rows != row_count:  # pragma: no cover
+            self.logger.error("Load {} Error: {} rows loaded out of {}".format(table_id, job.output_rows, row_count),
+                              extra=self.log_context)
+            return InsertResult(success=job.output_rows, failed=row_count - job.output_rows, load_stats=load_stats)
+        return InsertResult(success=row_count, load_stats=load_stats)
+
+    def _insert_rows(self, table_id: str, bq_table_id: str, rows, ingestion_mode: str = "") -> InsertResult:
+        ingestion_mode = ingestion_mode if ingestion_mode else self.ingestion_mode
+        if ingestion_mode not in self.ingestion_modes:
+            self.logger.error("Ingestion mode {} not supported".format(ingestion_mode), extra=self.log_context)
+            raise ValueError("XIA-010006")
+        if ingestion_mode == "load":
+            return self._load_rows(table_id, bq_table_id, rows)
+        else:
+            return self._stream_rows(table_id, bq_table_id, rows)
+
+    def append_log_data(self, table_id: str, field_data: List[dict], data: Iterable[dict], **kwargs):
+        """
+        Args:
+            data (:obj:`Iterable`): Rows to append, a list or any iterable (e.g. a generator decoding a source file).
+                Rows are consumed lazily: at most ``insert_max_inflight`` chunks are held in memory when streaming,
+                rows are staged in a spooled file for load jobs.
+
+        Keyword Args:
+            ingestion_mode (:obj:`str`): ``stream`` for streaming inserts, ``load`` for one batch load job
+            mutate_input (:obj:`bool`): Convert the given rows in place (default: adaptor setting)
+
+        Returns:
+            :obj:`InsertResult`: counts of inserted, retried and failed rows, evaluated as False if any row failed
         """
-        load_log_sql = self._get_load_log_sql(log_table_id, table_id, field_data, meta_data, start_age, end_age)
-        remove_old_log_sql = self._get_remove_old_log_sql(log_table_id, end_age)
+        # One timestamp for the whole batch
+        dt = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        bq_table_id = self._get_table_id(table_id, "")
+        rows = self._get_row_encoder(field_data).encode(data, dt, kwargs.get("mutate_input", self.mutate_input))
+        index = self._get_value_index(bq_table_id)
+        if index is not None:
+            rows = index.track(rows)
+        result = self._insert_rows(table_id, bq_table_id, rows, kwargs.get("ingestion_mode", ""))
+        self._save_value_index(bq_table_id)
+        return result
+
+    def _get_script_stats(self, job) -> list:
+        # Statistics of each statement are carried by the child jobs of the script
+        return [self._get_job_stats(child_job)
+                for child_job in reversed(list(self.connection.list_jobs(parent_job=job.job_id)))]
+
+    def submit_load_log_data(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                             start_age: int, end_age: int, remove_old_log: bool = True,
+                             update_fields: list = None) -> LoadHandle:
+        """Non-blocking version of load_log_data
+
+        The merge job is submitted and a handle is returned at once. Only the pruning value discovery
+        (when neither the value index nor the script mode is used) is still run before the submission.
+
+        A load split by the scan budget check only submits its first half, the second half is loaded by
+        ``result()`` of the handle. In script mode, the budget is checked against the plain merge, whose pruning
+        value discovery is then run once more by the script.
+
+        The insert-only fast path is only taken when no other load of the same target is pending: the target
+        table content is not known before the end of the previous loads.
+
+        Returns:
+            :obj:`LoadHandle`: handle whose ``result()`` gives the load_log_data return value
+        """
+        bq_table_id = self._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        with self._pending_loads_lock:
+            pipelined = self._pending_loads[bq_table_id] > 0
+            self._pending_loads[bq_table_id] += 1
+        try:
+            handle = self._submit_load_log_data(log_table_id, table_id, field_data, meta_data, start_age, end_age,
+                                                remove_old_log, update_fields, pipelined)
+        except Exception:
+            self._release_load(bq_table_id)
+            raise
+        if handle.job is None:
+            self._release_load(bq_table_id)
+            return handle
+        complete_func = handle._complete_func
+
+        def complete() -> bool:
+            try:
+                return complete_func()
+            finally:
+                self._release_load(bq_table_id)
+
+        handle._complete_func = complete
+        return handle
+
+    def _release_load(self, bq_table_id: str):
+        with self._pending_loads_lock:
+            self._pending_loads[bq_table_id] -= 1
+            if self._pending_loads[bq_table_id] <= 0:
+                del self._pending_loads[bq_table_id]
+
+    def _submit_load_log_data(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                              start_age: int, end_age: int, remove_old_log: bool, update_fields: list,
+                              pipelined: bool) -> LoadHandle:
+        bq_table_id = self._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        append_mode = self._get_table_mode(meta_data) == "append"
+        if append_mode and update_fields is not None:
+            self.logger.error("Partial updates couldn't be appended to {}".format(table_id), extra=self.log_context)
+            return LoadHandle(None, None)
+        # A pending load of the same target could insert keys the fast path wouldn't see
+        insert_only = not append_mode and not pipelined and \
+            self._is_insert_only(log_table_id, table_id, meta_data, start_age, end_age)
+        scan_budget = meta_data.get("scan_budget", self.scan_budget)
+        dry_run = {}
+        # Neither an append nor a plain insert scans the target table
+        if scan_budget and not append_mode and not insert_only:
+            # Dynamic SQL of the script can't be estimated: the plain merge is checked instead
+            merge_sql = self._get_load_log_sql(log_table_id, table_id, field_data, meta_data, start_age, end_age,
+                                               update_fields)
+            try:
+                estimated_bytes = self._dry_run(merge_sql, bq_table_id)
+            except Exception as e:
+                self.logger.error("Load {} dry run Error: {}".format(table_id, e), extra=self.log_context)
+                return LoadHandle(None, None)
+            dry_run = {"table_id": bq_table_id, "start_age": start_age, "end_age": end_age,
+                       "estimated_bytes": estimated_bytes, "scan_budget": scan_budget}
+            if estimated_bytes > scan_budget:
+                if self.budget_action == "split" and end_age > start_age:
+                    self.logger.warning("Load {} {}-{} scans {} bytes (budget {}), split".format(
+                        table_id, start_age, end_age, estimated_bytes, scan_budget), extra=self.log_context)
+                    middle_age = (start_age + end_age) // 2
+                    first = self.submit_load_log_data(log_table_id, table_id, field_data, meta_data,
+                                                      start_age, middle_age, remove_old_log, update_fields)
+
+                    def complete_split() -> bool:
+                        # The second half is merged after the first one, in age order
+                        return first.result() and \
+                            self.load_log_data(log_table_id, table_id, field_data, meta_data,
+                                               middle_age + 1, end_age, remove_old_log, update_fields)
+
+                    if first.job is None:
+                        return LoadHandle(None, None, complete_split(), dry_run)
+                    return LoadHandle(first.job, complete_split, dry_run=dry_run)
+                self.logger.error("Load {} {}-{} rejected: {} bytes to scan, budget {}".format(
+                    table_id, start_age, end_age, estimated_bytes, scan_budget), extra=self.log_context)
+                return LoadHandle(None, None, dry_run=dry_run)
+        if append_mode:
+            sql = self._get_append_log_sql(log_table_id, table_id, field_data, meta_data, start_age, end_age)
+        elif insert_only:
+            sql = self._get_insert_log_sql(log_table_id, table_id, field_data, meta_data, start_age, end_age)
+        elif self.use_script:
+            sql = self._get_load_log_script(log_table_id, table_id, field_data, meta_data, start_age, end_age,
+                                            remove_old_log, update_fields)
+        elif scan_budget:
+            sql = merge_sql
+        else:
+            sql = self._get_load_log_sql(log_table_id, table_id, field_data, meta_data, start_age, end_age,
+                                         update_fields)
+        start_time = time.monotonic()
+        kind = "append" if append_mode else "insert" if insert_only else "script" if self.use_script else "merge"
+        try:
+            job = self.connection.query(sql)
+        except Exception as e:  # pragma: no cover
+            self._emit("query", bq_table_id, start_time, kind=kind, error=str(e))  # pragma: no cover
+            self.logger.error("Load {} Error: {}".format(table_id, e), extra=self.log_context)  # pragma: no cover
+            return LoadHandle(None, None, dry_run=dry_run)  # pragma: no cover
+        if append_mode:
+            return LoadHandle(job, lambda: self._complete_append_log_data(job, log_table_id, table_id, field_data,
+                                                                          meta_data, end_age, remove_old_log,
+                                                                          start_time))
+        handle = LoadHandle(job, lambda: self._complete_load_log_data(job, log_table_id, end_age, remove_old_log,
+                                                                      bq_table_id, kind, start_time, handle),
+                            dry_run=dry_run)
+        return handle
+
+    def _complete_load_log_data(self, job, log_table_id: str, end_age: int, remove_old_log: bool,
+                                bq_table_id: str, kind: str, start_time: float, handle: LoadHandle = None) -> bool:
         try:
-            job = self.connection.query(load_log_sql)
             job.result()
         except Exception as e:  # pragma: no cover
+            self._emit("query", bq_table_id, start_time, kind=kind, error=str(e))  # pragma: no cover
+            self.logger.error("Load {} Error: {}".format(log_table_id, e), extra=self.log_context)  # pragma: no cover
             return False  # pragma: no cover
-        job = self.connection.query(remove_old_log_sql)
-        job.result()
+        self._emit("query", bq_table_id, start_time, kind=kind, job=self._get_job_stats(job))
+        if kind == "script":
+            if handle is not None:
+                handle.script_stats = self._get_script_stats(job)
+        elif remove_old_log:
+            self._run_query(self._get_remove_old_log_sql(log_table_id, end_age), self._get_table_id(log_table_id, ""),
+                            "cleanup")
+        index = self._get_value_index(self._get_table_id(log_table_id, ""))
+        if index is not None:
+            index.prune(end_age)
+            self._save_value_index(self._get_table_id(log_table_id, ""))
         return True
 
-    def append_normal_data(self, table_id: str, meta_data: dict, field_data: List[dict], data: List[dict], type: str,
-                           **kwargs):
+    def _complete_append_log_data(self, job, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                                  end_age: int, remove_old_log: bool, start_time: float) -> bool:
+        bq_table_id = self._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        if not self._complete_load_log_data(job, log_table_id, end_age, remove_old_log, bq_table_id, "append",
+                                            start_time):
+            return False  # pragma: no cover
+        state = self._compaction_state.setdefault(bq_table_id, {"rows": 0, "since": time.monotonic()})
+        state["rows"] += job.num_dml_affected_rows or 0
+        compact_rows, compact_interval = meta_data.get("compact_rows", 0), meta_data.get("compact_interval", 0)
+        if (compact_rows and state["rows"] >= compact_rows) or \
+                (compact_interval and time.monotonic() - state["since"] >= compact_interval):
+            # The load itself is done: a failed compaction is only tried again after the next load
+            self.compact_table(table_id, meta_data, field_data)
+        return True
+
+    def compact_table(self, table_id: str, meta_data: dict, field_data: List[dict]) -> bool:
+        """Rewrite an append mode table with its current rows only: the latest non-deleted row of each key
+
+        Could be called on any schedule. load_log_data calls it after ``compact_rows`` appended rows or
+        ``compact_interval`` seconds since the last compaction, when given by meta_data.
+        """
+        bq_table_id = self._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        try:
+            self._run_query(self._get_compact_script(bq_table_id, field_data), bq_table_id, "compact")
+        except Exception as e:
+            self.logger.error("Compaction of {} failed: {}".format(table_id, e), extra=self.log_context)
+            return False
+        self._compaction_state[bq_table_id] = {"rows": 0, "since": time.monotonic()}
+        return True
+
+    def load_log_data(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+                      start_age: int, end_age: int, remove_old_log: bool = True, update_fields: list = None):
+        """
+        Args:
+            remove_old_log (:obj:`bool`): Delete the merged rows from log table (False when the log table
+                is cleaned by other means, like :class:`LogRotationManager`)
+            update_fields (:obj:`list`): Non-key fields present in the change set. Only these columns are set
+                when a row is updated, the other ones keep their values. All non-key fields are set if None.
+
+        Notes:
+            The merge is replaced by a plain insert (no scan of the target table) when the target table is empty,
+            or when ``append_only`` of meta_data is True and the age range only holds inserts. ``append_only``
+            declares that the source never sends again a key already loaded.
+
+            With ``table_mode`` "append" of meta_data, the operations are appended to the target table as they
+            are (with _AGE, _NO and _OP), see :meth:`create_table` and :meth:`compact_table`. The log rows must
+            then hold full row images: update_fields is refused.
+
+        Warning:
+            To make the transactional-like update, the time-partition field of original table must contain fixed value.
+        """
+        return self.submit_load_log_data(log_table_id, table_id, field_data, meta_data, start_age, end_age,
+                                         remove_old_log, update_fields).result()
+
+    def append_normal_data(self, table_id: str, meta_data: dict, field_data: List[dict], data: Iterable[dict],
+                           type: str, **kwargs):
+        """
+        Args:
+            data (:obj:`Iterable`): Rows to append, a list or any iterable, consumed lazily as in append_log_data
+
+        Keyword Args:
+            ingestion_mode (:obj:`str`): ``stream`` for streaming inserts, ``load`` for one batch load job
+            mutate_input (:obj:`bool`): Convert the given rows in place (default: adaptor setting)
+
+        Returns:
+            :obj:`InsertResult`: counts of inserted, retried and failed rows, evaluated as False if any row failed
+        """
         segment_id = meta_data.get("segment", {}).get("id", "")
-        conv_func_dict = self.get_dt_conv_func_dict(field_data)
-        for i in range(((len(data) - 1) // 10000) + 1):
-            start, end = i * 10000, (i + 1) * 10000
-            load_data = []
-            for line in data[start: end]:
-                for field in [k for k in line if k in conv_func_dict]:
-                    line[field] = conv_func_dict[field](line[field])
-                load_data.append({self._escape_column_name(k): v for k, v in line.items()})
+        rows = self._get_row_encoder(field_data).encode(data, mutate_input=kwargs.get("mutate_input", self.mutate_input))
+        return self._insert_rows(table_id, self._get_table_id(table_id, segment_id), rows,
+                                 kwargs.get("ingestion_mode", ""))
+
+    def _get_segment_matcher(self, segment_config: dict):
+        """Function telling whether a row belongs to the segment"""
+        field_name = segment_config.get("field_name", "")
+        if segment_config.get("list"):
+            values = set(segment_config["list"])
+            return lambda line: line.get(field_name, None) in values
+        elif segment_config.get("min", None) is not None and segment_config.get("max", None) is not None:
+            min_value, max_value = segment_config["min"], segment_config["max"]
+            return lambda line: line.get(field_name, None) is not None and \
+                min_value <= line.get(field_name, None) <= max_value
+        elif segment_config.get("default", None) is not None:
+            default_value = segment_config["default"]
+            return lambda line: line.get(field_name, None) == default_value
+        elif segment_config.get("null", False):
+            return lambda line: line.get(field_name, None) is None
+        return lambda line: False
+
+    def _append_segment_worker(self, table_id: str, meta_data: dict, field_data: List[dict], type: str,
+                               row_queue: queue.Queue, kwargs: dict) -> InsertResult:
+        def get_rows():
+            while True:
+                batch = row_queue.get()
+                if batch is None:
+                    return
+                yield from batch
+
+        rows = get_rows()
+        try:
+            return self.append_normal_data(table_id, meta_data, field_data, rows, type, **kwargs)
+        except Exception:
+            # The router must never be blocked by the queue of a failed segment
+            for _ in rows:
+                pass
+            raise
+
+    def append_segment_data(self, table_id: str, meta_data: dict, segment_list: List[dict], field_data: List[dict],
+                            data: Iterable[dict], type: str, **kwargs) -> dict:
+        """Route rows to the segment tables and append them to all segments concurrently
+
+        A row goes to the first segment of the list it belongs to, by ``list``, ``min`` / ``max``, ``default``
+        (value equal to the default) or ``null`` definition. The rows are consumed lazily: each segment has a
+        bounded queue feeding its own append_normal_data.
+
+        Args:
+            segment_list (:obj:`list`): Segment configurations, each one replacing ``segment`` of meta_data
+            data (:obj:`Iterable`): Rows of all segments
+            type (:obj:`str`): Table type, as in append_normal_data
+
+        Keyword Args:
+            Passed to append_normal_data
+
+        Returns:
+            :obj:`dict`: InsertResult of each segment id. Rows belonging to no segment are counted as failed
+            under the None key.
+        """
+        matchers = [(segment.get("id", ""), self._get_segment_matcher(segment)) for segment in segment_list]
+        queues = {segment_id: queue.Queue(maxsize=self.insert_max_inflight) for segment_id, _ in matchers}
+        batches = {segment_id: [] for segment_id, _ in matchers}
+        routed = {segment_id: 0 for segment_id, _ in matchers}
+        unrouted = InsertResult()
+        with ThreadPoolExecutor(max_workers=max(len(segment_list), 1)) as executor:
+            # One worker per segment: a segment waiting for a free worker would block the router
+            futures = {segment.get("id", ""): executor.submit(contextvars.copy_context().run,
+                                                              self._append_segment_worker,
+                                                              table_id, dict(meta_data, segment=segment), field_data,
+                                                              type, queues[segment.get("id", "")], kwargs)
+                       for segment in segment_list}
             try:
-                errors = self.connection.insert_rows_json(self._get_table_id(table_id, segment_id), load_data)
-            except BadRequest as e:  # pragma: no cover
-                return False  # pragma: no cover
-            if errors == []:
-                continue
-            else:  # pragma: no cover
-                self.logger.error("Insert {} Error: {}".format(table_id, errors), extra=self.log_context)
-                return False
-        return True
+                for line in data:
+                    for segment_id, matcher in matchers:
+                        if matcher(line):
+                            batch = batches[segment_id]
+                            batch.append(line)
+                            routed[segment_id] += 1
+                            if len(batch) >= self.route_batch_rows:
+                                queues[segment_id].put(batch)
+                                batches[segment_id] = []
+                            break
+                    else:
+                        unrouted.failed += 1
+                        if len(unrouted.errors) < unrouted.max_errors:
+                            unrouted.errors.append("No segment for row {}".format(line))
+            finally:
+                for segment_id, batch in batches.items():
+                    if batch:
+                        queues[segment_id].put(batch)
+                    queues[segment_id].put(None)
+            results = dict()
+            for segment_id, future in futures.items():
+                try:
+                    results[segment_id] = future.result()
+                except Exception as e:
+                    self.logger.error("Segment {} append error: {}".format(segment_id, e), extra=self.log_context)
+                    # No row of the segment is confirmed
+                    results[segment_id] = InsertResult(failed=routed[segment_id], errors=[str(e)])
+        if unrouted.failed:
+            self.logger.error("{} rows belong to no segment".format(unrouted.failed), extra=self.log_context)
+            results[None] = unrouted
+        return results
 
     def upsert_data(self, table_id: str, field_data: List[dict], data: List[dict], **kwargs):
         self.logger.error("Bigquery Adaptor does not support upsert on-the-fly", extra=self.log_context)
         return False
 
+    def _get_table_layout(self, table) -> tuple:
+        """Schema, clustering and partitioning of a table: what a purge must keep"""
+        time_partitioning, range_partitioning = table.time_partitioning, table.range_partitioning
+        return (
+            [(field.name, self._legacy_types.get(field.field_type, field.field_type), field.mode or "NULLABLE")
+             for field in table.schema],
+            list(table.clustering_fields or []),
+            (time_partitioning.type_, time_partitioning.field) if time_partitioning else None,
+            (range_partitioning.field, range_partitioning.range_.start, range_partitioning.range_.end,
+             range_partitioning.range_.interval) if range_partitioning else None,
+        )
+
+    def truncate_table(self, table_id: str, meta_data: dict) -> bool:
+        """Remove all rows of a table, its schema, partitioning and clustering are kept
+
+        ``TRUNCATE TABLE`` is used (no bytes billed). A table with streaming buffer, which refuses DML statements,
+        is replaced by the empty result of a free ``LIMIT 0`` query instead. Rows still in the streaming buffer at
+        that moment might not be removed, so False is returned in this case as the table isn't known to be empty.
+        """
+        bq_table_id = self._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        index = self._get_value_index(bq_table_id)
+        self._forget_table(bq_table_id)
+        try:
+            # Fresh table metadata: the streaming buffer state is never cached
+            table = self._call_api("get_table", bq_table_id, bq_table_id)
+            if table.streaming_buffer is None:
+                self._run_query("TRUNCATE TABLE {}".format(bq_table_id), bq_table_id, "truncate")
+            else:
+                job_config = bigquery.QueryJobConfig(
+                    destination=bq_table_id,
+                    write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+                    time_partitioning=table.time_partitioning,
+                    range_partitioning=table.range_partitioning,
+                    clustering_fields=table.clustering_fields,
+                )
+                self._run_query("SELECT * FROM {} LIMIT 0".format(bq_table_id), bq_table_id, "truncate", job_config)
+        except exceptions.NotFound as e:
+            self.logger.error("Table to truncate not found: {}".format(e), extra=self.log_context)
+            return False
+        except (exceptions.BadRequest, exceptions.GoogleAPICallError) as e:  # pragma: no cover
+            self.logger.error("Table truncate failed: {}".format(e), extra=self.log_context)
+            return False
+        if index is not None and table.streaming_buffer is None:
+            # An emptied log table is fully known again
+            self._value_indexes[bq_table_id] = _LogValueIndex(index.fields, index.time_fields, index.max_values)
+            self._save_value_index(bq_table_id)
+        if table.streaming_buffer is not None:
+            self.logger.error("Table with streaming buffer couldn't be fully truncated", extra=self.log_context)
+            return False
+        return True
+
     def purge_segment(self, table_id: str, meta_data: dict, field_data: List[dict], type: str):
+        """
+        The table is truncated when its layout is unchanged, dropped and created again otherwise
+        """
+        bq_table_id = self._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        try:
+            table = self._get_table(bq_table_id)
+        except exceptions.NotFound as e:
+            return self.create_table(table_id, meta_data, field_data, type)
+        new_table = self._get_table_definition(table_id, meta_data, field_data, type)
+        if self._get_table_layout(table) == self._get_table_layout(new_table):
+            return self.truncate_table(table_id, meta_data)
         if self.drop_table(table_id, meta_data):
             return self.create_table(table_id, meta_data, field_data, type)
         else:
             return False
 
-    def create_table(self, table_id: str, meta_data: dict, field_data: List[dict], type: str):
-        # Dataset level operation
-        dataset = bigquery.Dataset(self._get_dataset_id(table_id))
-        dataset.location = self.location
-        try:
-            self.connection.create_dataset(dataset, timeout=30)
-        except Conflict as e:
-            self.logger.info("Dataset already exists, donothing", extra=self.log_context)
+    def purge_segments(self, table_id: str, meta_data: dict, segment_list: List[dict], field_data: List[dict],
+                       type: str, max_workers: int = 8) -> dict:
+        """Purge many segments of a table concurrently
 
+        Args:
+            segment_list (:obj:`list`): Segment configurations, each one replacing ``segment`` of meta_data
+            max_workers (:obj:`int`): Maximum number of segments purged at the same time
+
+        Returns:
+            :obj:`dict`: purge_segment result of each segment id
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {segment.get("id", ""): executor.submit(contextvars.copy_context().run, self.purge_segment,
+                                                              table_id, dict(meta_data, segment=segment),
+                                                              field_data, type)
+                       for segment in segment_list}
+        return {segment_id: future.result() for segment_id, future in futures.items()}
+
+    def _get_table_definition(self, table_id: str, meta_data: dict, field_data: List[dict], type: str):
         # Table Schema Definition
         segment_id = meta_data.get("segment", {}).get("id", "")
         field_list = field_data.copy()
-        field_list.extend(self.table_extension.get(type))
+        if type == "raw" and self._get_table_mode(meta_data) == "append":
+            field_list.extend(self.table_extension["appended"])
+        else:
+            field_list.extend(self.table_extension.get(type))
         schema = self._get_table_schema(field_list)
         table = bigquery.Table(self._get_table_id(table_id, segment_id), schema=schema)
         # Table Clustering
@@ -342,31 +1670,82 @@ class BigQueryAdaptor(Adaptor):
                     expiration_ms=None
                 )
                 break
+            elif field_config.get("type", "") == "range":
+                table.range_partitioning = self._get_range_partitioning(field_name, field_config["start"],
+                                                                        field_config["end"],
+                                                                        field_config.get("interval", 0))
+                break
+        else:
+            # Integer segments with known bounds are partitioned by the segment field
+            segment_bounds = self._get_segment_bounds(meta_data.get("segment", {}))
+            if segment_bounds and segment_bounds[1] > segment_bounds[0]:
+                table.range_partitioning = self._get_range_partitioning(meta_data["segment"]["field_name"],
+                                                                        segment_bounds[0], segment_bounds[1] + 1)
         # Table Expiration
         if isinstance(meta_data.get("expires_at", 0), (float, int)) and \
             meta_data.get("expires_at", 0) > datetime.now().timestamp():
             table.expires = datetime.fromtimestamp(meta_data["expires_at"])
+        return table
+
+    def create_table(self, table_id: str, meta_data: dict, field_data: List[dict], type: str):
+        """
+        With ``table_mode`` "append" of meta_data, a raw table gets the _AGE, _NO and _OP columns and a view
+        (see :meth:`get_view_id`) giving the latest non-deleted row of each key. Readers should query the view.
+        """
+        # Dataset level operation
+        dataset_id = self._get_dataset_id(table_id)
+        if not self._dataset_cache.get(dataset_id, False):
+            dataset = bigquery.Dataset(dataset_id)
+            dataset.location = self.location
+            try:
+                self._call_api("create_dataset", dataset_id, dataset, timeout=30)
+            except exceptions.Conflict as e:
+                self.logger.info("Dataset already exists, donothing", extra=self.log_context)
+            self._dataset_cache.set(dataset_id, True)
+
+        segment_id = meta_data.get("segment", {}).get("id", "")
+        table = self._get_table_definition(table_id, meta_data, field_data, type)
         try:
-            table = self.connection.create_table(table, True, timeout=30)
+            table = self._call_api("create_table", self._get_table_id(table_id, segment_id), table, True, timeout=30)
+            self._table_cache.set(self._get_table_id(table_id, segment_id), table)
+            # Only an empty log table could be fully known by the value index
+            if self.value_index and type == "aged" and not table.num_rows and table.streaming_buffer is None:
+                self._create_value_index(self._get_table_id(table_id, segment_id), field_data)
+            if type == "raw" and self._get_table_mode(meta_data) == "append":
+                view = bigquery.Table(self.get_view_id(table_id, segment_id))
+                view.view_query = "SELECT * EXCEPT(_AGE, _NO, _OP) FROM ({})".format(
+                    self._get_current_sql(self._get_table_id(table_id, segment_id), field_data))
+                view.expires = table.expires
+                self._call_api("create_table", self._get_table_id(table_id, segment_id), view, True, timeout=30)
             self.logger.info("Created table {}".format(table.table_id), extra=self.log_context)
             return True
-        except BadRequest as e:  # pragma: no cover
+        except exceptions.BadRequest as e:  # pragma: no cover
             self.logger.error("Table Creation Failed: {}".format(e), extra=self.log_context)
             return False
 
+    def _forget_table(self, bq_table_id: str):
+        """Remove a dropped table from the metadata cache and the value index"""
+        self._table_cache.pop(bq_table_id)
+        self._drop_value_index(bq_table_id)
+
     def drop_table(self, table_id: str, meta_data: dict):
         segment_id = meta_data.get("segment", {}).get("id", "")
+        self._forget_table(self._get_table_id(table_id, segment_id))
+        # Streaming buffer is checked from table metadata: no need to empty the table by a DML job before
         try:
-            delete_all_sql = self.delete_sql_template.format(self._get_table_id(table_id, segment_id), "1 = 1")
-            delete_job = self.connection.query(delete_all_sql)
-            delete_job.result()
-        except BadRequest as e:
-            self.logger.error("Table with streaming buffer couldn't be dropped: {}".format(e), extra=self.log_context)
-            return False
-        except NotFound as e:
+            table = self._call_api("get_table", self._get_table_id(table_id, segment_id),
+                                   self._get_table_id(table_id, segment_id))
+        except exceptions.NotFound as e:
             return True
+        if table.streaming_buffer is not None:
+            self.logger.error("Table with streaming buffer couldn't be dropped", extra=self.log_context)
+            return False
         try:
-            self.connection.delete_table(self._get_table_id(table_id, segment_id), not_found_ok=True, timeout=30)
+            self._call_api("delete_table", self._get_table_id(table_id, segment_id),
+                           self._get_table_id(table_id, segment_id), not_found_ok=True, timeout=30)
+            if self._get_table_mode(meta_data) == "append":
+                self._call_api("delete_table", self._get_table_id(table_id, segment_id),
+                               self.get_view_id(table_id, segment_id), not_found_ok=True, timeout=30)
         except Exception as e:  # pragma: no cover
             self.logger.error("Table drop failed: {}".format(e), extra=self.log_context)
             return False
@@ -379,21 +1758,46 @@ class BigQueryAdaptor(Adaptor):
         new_type = self._get_field_type(new_field_line['type_chain'])
         return True if old_type == new_type else False
 
-    def add_column(self, table_id: str, meta_data: dict, new_field_line: dict):
+    def add_columns(self, table_id: str, meta_data: dict, new_field_lines: List[dict]) -> List[str]:
+        """Add many columns by a single schema update
+
+        Columns already in the table are skipped. The update is conditioned by the etag of the table and tried
+        again once with fresh metadata if the table was modified in the meantime.
+
+        Returns:
+            :obj:`list`: Names of the added columns, empty if nothing was added or if the update failed
+        """
         segment_id = meta_data.get("segment", {}).get("id", "")
         if not self.support_add_column:
-            return False
-        field_list = [new_field_line]
-        table = self.connection.get_table(self._get_table_id(table_id, segment_id))
-        original_schema = table.schema
-        new_schema = original_schema[:]
-        new_schema.extend(self._get_table_schema(field_list))
-        table.schema = new_schema
-        try:
-            table = self.connection.update_table(table, ["schema"])
-            self.logger.info("Table Column {} is added".format(new_field_line), extra=self.log_context)
-            return True if len(table.schema) == len(original_schema) + 1 == len(new_schema) else False
-        except Exception as e:  # pragma: no cover
-            self.logger.error("SQL Error: {}".format(e), extra=self.log_context)  # pragma: no cover
-            return False  # pragma: no cover
+            return []
+        bq_table_id = self._get_table_id(table_id, segment_id)
+        for attempt in range(2):
+            table = self._get_table(bq_table_id)
+            original_schema = table.schema
+            existing_names = {field.name for field in original_schema}
+            new_fields = list({field['name']: field for field in self._get_table_schema(new_field_lines)
+                               if field['name'] not in existing_names}.values())
+            if not new_fields:
+                return []
+            table.schema = original_schema[:] + new_fields
+            try:
+                # The update is conditioned by the etag of the (possibly cached) table
+                table = self._call_api("update_table", bq_table_id, table, ["schema"])
+                self._table_cache.set(bq_table_id, table)
+                updated_names = {field.name for field in table.schema}
+                added_names = [field['name'] for field in new_fields if field['name'] in updated_names]
+                self.logger.info("Table Columns {} are added".format(added_names), extra=self.log_context)
+                return added_names
+            except exceptions.PreconditionFailed as e:  # pragma: no cover
+                self._table_cache.pop(bq_table_id)  # Outdated cache entry, try again with a fresh table
+            except Exception as e:  # pragma: no cover
+                self._table_cache.pop(bq_table_id)  # pragma: no cover
+                self.logger.error("SQL Error: {}".format(e), extra=self.log_context)  # pragma: no cover
+                return []  # pragma: no cover
+        self.logger.error("Table {} modified concurrently".format(bq_table_id), extra=self.log_context)  # pragma: no cover
+        return []  # pragma: no cover
+
+    def add_column(self, table_id: str, meta_data: dict, new_field_line: dict):
+        added_names = self.add_columns(table_id, meta_data, [new_field_line])
+        return self._escape_column_name(new_field_line['field_name']) in added_names
 
@@ -0,0 +1,146 @@
+import time
+import atexit
+import threading
+import contextvars
+
+
+class MergeCoalescer:
+    """Coalesce small age ranges of the same target into one load_log_data
+
+    Contiguous age ranges of a target table (table id + segment) are collected and merged as a single range
+    when one of the thresholds is reached. A range which doesn't follow the pending one, or which comes from
+    another log table, starts a new group and the previous groups are merged. Groups of a target are always
+    merged in order, a failed merge keeps its group (and all the following ones) pending.
+
+    Args:
+        adaptor (:obj:`BigQueryAdaptor`): Adaptor used to run the loads
+        max_ranges (:obj:`int`): Flush when a target has collected this number of ranges
+        max_rows (:obj:`int`): Flush when a target has collected this number of rows (as declared by add)
+        max_latency (:obj:`float`): Flush when the oldest pending range of a target is older than this (seconds)
+        drain_at_exit (:obj:`bool`): Flush everything at interpreter shutdown
+
+    Examples:
+        >>> with MergeCoalescer(adaptor, max_ranges=50, max_latency=60) as coalescer:
+        ...     coalescer.add(log_table_id, table_id, field_data, meta_data, 103, 104, row_count=3)
+        ...     coalescer.add(log_table_id, table_id, field_data, meta_data, 105, 105, row_count=1)
+    """
+    def __init__(self, adaptor, max_ranges: int = 20, max_rows: int = 100000, max_latency: float = 30.0,
+                 drain_at_exit: bool = True):
+        self.adaptor = adaptor
+        self.max_ranges = max_ranges
+        self.max_rows = max_rows
+        self.max_latency = max_latency
+        self._lock = threading.Lock()
+        self._target_locks = dict()
+        self._pending = dict()
+        self._stop_event = threading.Event()
+        self._timer = threading.Thread(target=self._flush_expired_loop, daemon=True)
+        self._timer.start()
+        self._drain_at_exit = drain_at_exit
+        if drain_at_exit:
+            atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_target(self, table_id: str, meta_data: dict) -> str:
+        return self.adaptor._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+
+    def _get_target_lock(self, target: str) -> threading.Lock:
+        with self._lock:
+            return self._target_locks.setdefault(target, threading.Lock())
+
+    def add(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+            start_age: int, end_age: int, row_count: int = 0) -> bool:
+        """Collect an age range, the merge is run at once if a threshold is reached
+
+        Returns:
+            :obj:`bool`: False if a merge triggered by this call has failed (its ranges are kept pending)
+        """
+        target = self._get_target(table_id, meta_data)
+        with self._get_target_lock(target):
+            with self._lock:
+                groups = self._pending.setdefault(target, [])
+                last = groups[-1] if groups else None
+                if last is not None and last["log_table_id"] == log_table_id and \
+                        last["field_data"] == field_data and last["end_age"] + 1 == start_age:
+                    last.update({"meta_data": meta_data, "end_age": end_age,
+                                 "ranges": last["ranges"] + 1, "rows": last["rows"] + row_count})
+                else:
+                    groups.append({"log_table_id": log_table_id, "table_id": table_id,
+                                   "field_data": field_data, "meta_data": meta_data,
+                                   "start_age": start_age, "end_age": end_age,
+                                   "ranges": 1, "rows": row_count, "since": time.monotonic(),
+                                   # Merged in the context of the add, even by the latency timer
+                                   "context": contextvars.copy_context()})
+                threshold_hit = sum(group["ranges"] for group in groups) >= self.max_ranges or \
+                    sum(group["rows"] for group in groups) >= self.max_rows
+                closed_group = len(groups) > 1
+            if threshold_hit:
+                return self._flush_target(target)
+            elif closed_group:
+                # A non-contiguous range closes the previous groups, which could be merged already
+                return self._flush_target(target, keep_last=True)
+            return True
+
+    def _flush_target(self, target: str, keep_last: bool = False) -> bool:
+        """Merge the pending groups of a target in order, target lock must be held by the caller
+
+        Args:
+            keep_last (:obj:`bool`): Leave the last group pending so that it could still grow
+        """
+        while True:
+            with self._lock:
+                groups = self._pending.get(target, [])
+                if not groups or (keep_last and len(groups) == 1):
+                    if not groups:
+                        self._pending.pop(target, None)
+                    return True
+                group = groups[0]
+            try:
+                result = group["context"].run(self.adaptor.load_log_data, group["log_table_id"], group["table_id"],
+                                              group["field_data"], group["meta_data"], group["start_age"],
+                                              group["end_age"])
+            except Exception as e:
+                self.adaptor.logger.error("Load {} Error: {}".format(target, e), extra=self.adaptor.log_context)
+                result = False
+            if not result:
+                return False  # The group stays ahead of the queue
+            with self._lock:
+                groups.pop(0)
+
+    def flush(self, table_id: str = None, meta_data: dict = None) -> bool:
+        """Merge the pending ranges of the given table (and segment), of all tables if no table is given"""
+        if table_id is not None:
+            targets = [self._get_target(table_id, meta_data if meta_data else {})]
+        else:
+            with self._lock:
+                targets = list(self._pending)
+        result = True
+        for target in targets:
+            with self._get_target_lock(target):
+                result = self._flush_target(target) and result
+        return result
+
+    def _flush_expired_loop(self):
+        while not self._stop_event.wait(max(self.max_latency / 4, 0.1)):
+            now = time.monotonic()
+            with self._lock:
+                targets = [target for target, groups in self._pending.items()
+                           if groups and now - groups[0]["since"] >= self.max_latency]
+            for target in targets:
+                with self._get_target_lock(target):
+                    self._flush_target(target)
+
+    def close(self) -> bool:
+        """Stop the latency timer and merge everything still pending"""
+        self._stop_event.set()
+        if self._timer.is_alive() and self._timer is not threading.current_thread():
+            self._timer.join()
+        if self._drain_at_exit:
+            atexit.unregister(self.close)
+            self._drain_at_exit = False
+        return self.flush()
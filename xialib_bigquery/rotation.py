@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import List
+
+
+class LogRotationManager:
+    """Rotating log tables of a target table, cleaned by table / partition drops instead of DML deletes
+
+    Rows are appended to the current log table. Once sealed (by size, by age or on demand), a log table is
+    never written again and is dropped as a whole when all its ages are merged. The hourly ``_DT`` partitions
+    of the tables still in use are dropped as soon as all their ages are merged and they are old enough to be
+    out of the streaming buffer. The merged age high-water mark is tracked so that no DML delete is needed.
+    It only moves over contiguous merged ranges: a range merged before a lower one is kept pending until the
+    gap is merged too.
+
+    Warning:
+        All rows of the managed log tables must be appended through this manager.
+
+    Args:
+        adaptor (:obj:`BigQueryAdaptor`): Adaptor used to create, append, merge and drop
+        table_id (:obj:`str`): Target table id
+        field_data (:obj:`list`): Field definitions of the target table
+        segment_id (:obj:`str`): Segment of the target table
+        rotate_rows (:obj:`int`): Seal the current log table after this number of rows
+        rotate_seconds (:obj:`float`): Seal the current log table after this number of seconds
+        partition_delay (:obj:`int`): Minutes after the end of an hour before its partition could be dropped
+        state_path (:obj:`str`): Json file to persist the rotation state, in memory only if empty
+    """
+    def __init__(self, adaptor, table_id: str, field_data: List[dict], segment_id: str = "",
+                 rotate_rows: int = 10 ** 7, rotate_seconds: float = 3600, partition_delay: int = 90,
+                 state_path: str = ""):
+        self.adaptor = adaptor
+        self.table_id = table_id
+        self.field_data = field_data
+        self.segment_id = segment_id
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.partition_delay = partition_delay
+        self.state_path = state_path
+        self.high_water_mark = -1
+        self.merged_ranges = list()
+        self.log_tables = list()
+        self._lock = threading.RLock()
+        if state_path and os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as fp:
+                state = json.load(fp)
+            self.high_water_mark = state["high_water_mark"]
+            self.log_tables = state["log_tables"]
+            self.merged_ranges = state.get("merged_ranges", [])
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as fp:
+            json.dump({"high_water_mark": self.high_water_mark, "merged_ranges": self.merged_ranges,
+                       "log_tables": self.log_tables}, fp)
+        os.replace(temp_path, self.state_path)
+
+    @property
+    def current(self) -> dict:
+        """State of the current (writable) log table, None if it is not created yet"""
+        return self.log_tables[-1] if self.log_tables and not self.log_tables[-1]["sealed"] else None
+
+    def _create_log_table(self) -> dict:
+        log_table_id = self.adaptor.get_log_table_id(self.table_id, self.segment_id)
+        if any(log_table["log_table_id"] == log_table_id for log_table in self.log_tables):
+            log_table_id += "_" + str(len(self.log_tables))
+        if not self.adaptor.create_table(log_table_id, self.adaptor.log_table_meta, self.field_data, "aged"):
+            raise RuntimeError("Log table {} creation failed".format(log_table_id))
+        log_table = {"log_table_id": log_table_id, "created": time.time(), "sealed": False, "rows": 0,
+                     "min_age": None, "max_age": None, "partitions": {}}
+        self.log_tables.append(log_table)
+        self._save_state()
+        return log_table
+
+    def seal(self):
+        """Close the current log table, the next append goes to a new one"""
+        with self._lock:
+            if self.current is not None:
+                self.current["sealed"] = True
+                self._save_state()
+
+    def _track(self, data, ages: list):
+        for line in data:
+            age = line.get("_AGE", None)
+            if age is not None:
+                ages[0] = age if ages[0] is None else min(ages[0], age)
+                ages[1] = age if ages[1] is None else max(ages[1], age)
+            ages[2] += 1
+            yield line
+
+    def append(self, data, **kwargs):
+        """Append log rows to the current log table, keyword arguments are passed to append_log_data"""
+        with self._lock:
+            log_table = self.current
+            if log_table is not None and (log_table["rows"] >= self.rotate_rows or
+                                          time.time() - log_table["created"] >= self.rotate_seconds):
+                self.seal()
+                log_table = None
+            if log_table is None:
+                log_table = self._create_log_table()
+            ages = [None, None, 0]
+            # The batch _DT is set by the adaptor between these two instants
+            hours = {datetime.now().strftime("%Y%m%d%H")}
+            result = self.adaptor.append_log_data(log_table["log_table_id"], self.field_data,
+                                                  self._track(data, ages), **kwargs)
+            hours.add(datetime.now().strftime("%Y%m%d%H"))
+            if ages[0] is not None:
+                log_table["min_age"] = ages[0] if log_table["min_age"] is None else min(log_table["min_age"], ages[0])
+                log_table["max_age"] = ages[1] if log_table["max_age"] is None else max(log_table["max_age"], ages[1])
+                for hour in hours:
+                    log_table["partitions"][hour] = max(log_table["partitions"].get(hour, ages[1]), ages[1])
+            log_table["rows"] += ages[2]
+            self._save_state()
+            return result
+
+    def load(self, meta_data: dict, start_age: int, end_age: int) -> bool:
+        """Merge an age range from all log tables holding it, then clean the fully merged tables / partitions"""
+        with self._lock:
+            log_tables = [log_table for log_table in self.log_tables if log_table["min_age"] is not None and
+                          log_table["min_age"] <= end_age and log_table["max_age"] >= start_age]
+        # Older log tables hold older ages: they must be merged first
+        for log_table in log_tables:
+            if not self.adaptor.load_log_data(log_table["log_table_id"], self.table_id, self.field_data, meta_data,
+                                              start_age, end_age, remove_old_log=False):
+                return False
+        self.mark_merged(start_age, end_age)
+        return self.cleanup()
+
+    def mark_merged(self, start_age: int, end_age: int):
+        """Record a merged age range, the high-water mark is raised over the ranges following it without gap"""
+        with self._lock:
+            self.merged_ranges.append([start_age, end_age])
+            # Ages lower than those of the managed log tables have nothing left to merge
+            min_ages = [log_table["min_age"] for log_table in self.log_tables if log_table["min_age"] is not None]
+            mark = max(self.high_water_mark, min(min_ages) - 1) if min_ages else self.high_water_mark
+            pending = list()
+            for merged_range in sorted(self.merged_ranges):
+                if merged_range[0] <= mark + 1:
+                    mark = max(mark, merged_range[1])
+                else:
+                    pending.append(merged_range)
+            self.merged_ranges = pending
+            self.high_water_mark = max(self.high_water_mark, mark)
+            self._save_state()
+
+    def cleanup(self) -> bool:
+        """Drop sealed log tables and expired hourly partitions whose ages are all merged"""
+        result = True
+        limit = (datetime.now() - timedelta(minutes=self.partition_delay, hours=1)).strftime("%Y%m%d%H")
+        with self._lock:
+            for log_table in list(self.log_tables):
+                bq_log_table_id = self.adaptor._get_table_id(log_table["log_table_id"], "")
+                if log_table["sealed"] and (log_table["max_age"] is None or
+                                            log_table["max_age"] <= self.high_water_mark):
+                    try:
+                        self.adaptor._call_api("delete_table", bq_log_table_id, bq_log_table_id,
+                                               not_found_ok=True, timeout=30)
+                    except Exception as e:  # pragma: no cover
+                        self.adaptor.logger.error("Log table drop failed: {}".format(e),
+                                                  extra=self.adaptor.log_context)
+                        result = False
+                        continue
+                    self.adaptor._forget_table(bq_log_table_id)
+                    self.log_tables.remove(log_table)
+                    continue
+                for hour, max_age in sorted(log_table["partitions"].items()):
+                    if hour > limit or max_age > self.high_water_mark:
+                        continue
+                    try:
+                        self.adaptor._call_api("delete_table", bq_log_table_id, bq_log_table_id + "$" + hour,
+                                               not_found_ok=True, timeout=30)
+                    except Exception as e:  # pragma: no cover
+                        self.adaptor.logger.error("Log partition drop failed: {}".format(e),
+                                                  extra=self.adaptor.log_context)
+                        result = False
+                        continue
+                    del log_table["partitions"][hour]
+            self._save_state()
+        return result
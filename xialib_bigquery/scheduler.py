@@ -0,0 +1,102 @@
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+
+class LoadScheduler:
+    """Run load_log_data of many targets concurrently
+
+    Loads of the same target table (table id + segment) are run one after another in submission order,
+    loads of different targets are run in parallel up to ``max_concurrency``. When a load fails, the
+    following loads of the same target are skipped, so that age ranges are never merged out of order.
+
+    Args:
+        adaptor (:obj:`BigQueryAdaptor`): Adaptor used to run the loads
+        max_concurrency (:obj:`int`): Maximum number of loads running at the same time
+
+    Examples:
+        >>> with LoadScheduler(adaptor, max_concurrency=16) as scheduler:
+        ...     for log_table_id, table_id, meta_data, start_age, end_age in targets:
+        ...         scheduler.submit(log_table_id, table_id, field_data, meta_data, start_age, end_age)
+        >>> scheduler.report()
+    """
+    def __init__(self, adaptor, max_concurrency: int = 8):
+        self.adaptor = adaptor
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._lock = threading.Lock()
+        self._queues = dict()
+        self._records = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, log_table_id: str, table_id: str, field_data: list, meta_data: dict,
+               start_age: int, end_age: int) -> Future:
+        """Schedule a load, returns a future of the load_log_data result"""
+        target = self.adaptor._get_table_id(table_id, meta_data.get("segment", {}).get("id", ""))
+        record = {"target": target, "log_table_id": log_table_id, "table_id": table_id,
+                  "start_age": start_age, "end_age": end_age, "status": "pending", "duration": None}
+        future = Future()
+        with self._lock:
+            self._records.append(record)
+            queue = self._queues.setdefault(target, deque())
+            # The load runs in the context of its submission, so that adaptor.track() of the caller sees it
+            queue.append((future, record, contextvars.copy_context(),
+                          (log_table_id, table_id, field_data, meta_data, start_age, end_age)))
+            if len(queue) == 1:
+                self._executor.submit(self._run, target)
+        return future
+
+    def _run(self, target: str):
+        with self._lock:
+            future, record, context, args = self._queues[target][0]
+        start_time = time.monotonic()
+        record["status"] = "running"
+        try:
+            result = context.run(self.adaptor.load_log_data, *args)
+        except Exception as e:
+            self.adaptor.logger.error("Load {} Error: {}".format(target, e), extra=self.adaptor.log_context)
+            result = False
+        record["duration"] = time.monotonic() - start_time
+        record["status"] = "done" if result else "failed"
+        with self._lock:
+            queue = self._queues[target]
+            queue.popleft()
+            if not result:
+                # Next age ranges of the target must not be merged before the failed one
+                while queue:
+                    skipped_future, skipped_record, _, _ = queue.popleft()
+                    skipped_record["status"] = "skipped"
+                    skipped_future.set_result(False)
+            if queue:
+                self._executor.submit(self._run, target)
+            else:
+                del self._queues[target]
+        future.set_result(result)
+
+    def wait(self) -> List[dict]:
+        """Block until all submitted loads are finished, returns the report"""
+        while True:
+            with self._lock:
+                futures = [item[0] for queue in self._queues.values() for item in queue]
+            if not futures:
+                return self.report()
+            for future in futures:
+                future.result()
+
+    def report(self) -> List[dict]:
+        """Status (pending, running, done, failed or skipped) and duration of each submitted load"""
+        with self._lock:
+            return [record.copy() for record in self._records]
+
+    def close(self):
+        """Wait for all loads and release the worker threads"""
+        self.wait()
+        self._executor.shutdown(wait=True)
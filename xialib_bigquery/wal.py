@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import threading
+from typing import List, Iterable
+
+
+class WriteAheadBuffer:
+    """Durable local buffer of log rows, sent to the log tables by group commit
+
+    Rows are appended to segment files (one json line per row, a header line giving the log table and its field
+    data) and acknowledged once written and synced to disk. A background flusher seals the segments, by size or
+    by age, and sends each of them with a single append_log_data call: many small appends become a few large
+    inserts. A segment file is removed once fully sent. The segments found at start-up (left by a crash or by a
+    failed send) are sent again.
+
+    Delivery is at-least-once: a segment partially inserted before a failure is sent again as a whole. Duplicated
+    log rows carry the same _AGE and _NO and are reduced to one by the merge of load_log_data. A segment still
+    failing after ``max_attempts`` sends is moved aside as a dead-letter file (``.dead`` suffix), so that a
+    permanently invalid row doesn't make its good rows inserted again and again.
+
+    Warning:
+        Rows reach the log table only when their segment is sent: call :meth:`flush` before merging their ages.
+
+    Args:
+        adaptor (:obj:`BigQueryAdaptor`): Adaptor used to send the segments
+        wal_dir (:obj:`str`): Directory of the segment files
+        segment_rows (:obj:`int`): Seal a segment after this number of rows
+        segment_bytes (:obj:`int`): Seal a segment after this size
+        flush_interval (:obj:`float`): Seal and send the segments older than this (seconds)
+        fsync (:obj:`bool`): Sync the segment files to disk before acknowledging an append
+        ingestion_mode (:obj:`str`): Ingestion mode of the sends, adaptor setting if empty
+        max_attempts (:obj:`int`): Sends of a segment before it is moved to a dead-letter file
+
+    Examples:
+        >>> with WriteAheadBuffer(adaptor, "/var/lib/xia/wal", ingestion_mode="load") as buffer:
+        ...     buffer.append(log_table_id, field_data, rows)
+        ...     buffer.flush(log_table_id)
+        ...     adaptor.load_log_data(log_table_id, table_id, field_data, meta_data, start_age, end_age)
+    """
+    segment_suffix = ".wal"
+    dead_suffix = ".dead"
+
+    def __init__(self, adaptor, wal_dir: str, segment_rows: int = 100000, segment_bytes: int = 2 ** 26,
+                 flush_interval: float = 5.0, fsync: bool = True, ingestion_mode: str = "", max_attempts: int = 5):
+        self.adaptor = adaptor
+        self.wal_dir = wal_dir
+        self.segment_rows = segment_rows
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.ingestion_mode = ingestion_mode
+        self.max_attempts = max_attempts
+        self.stats = {"segments_sent": 0, "rows_sent": 0, "send_failures": 0, "segments_dead": 0}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._open = dict()
+        self._sealed = list()
+        self._next_seq = 0
+        os.makedirs(wal_dir, exist_ok=True)
+        self._recover()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _sync_dir(self):
+        # Creation and removal of segment files must be durable too (POSIX only)
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(self.wal_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _recover(self):
+        for file_name in sorted(os.listdir(self.wal_dir)):
+            if file_name.endswith(self.dead_suffix):
+                # Sequence numbers of dead-letter files are not reused
+                self._next_seq = max(self._next_seq, int(file_name[:-len(self.dead_suffix)]) + 1)
+                continue
+            if not file_name.endswith(self.segment_suffix):
+                continue
+            path = os.path.join(self.wal_dir, file_name)
+            self._next_seq = max(self._next_seq, int(file_name[:-len(self.segment_suffix)]) + 1)
+            with open(path, "rb") as fp:
+                header_line = fp.readline()
+                row_count = sum(1 for line in fp if line.endswith(b"\n"))
+            if not header_line.endswith(b"\n"):
+                # Crash at segment creation: no row of this segment has been acknowledged
+                os.remove(path)
+                continue
+            header = json.loads(header_line)
+            self._sealed.append({"path": path, "table_id": header["table_id"], "field_data": header["field_data"],
+                                 "rows": row_count, "sealed": True})
+        if self._sealed:
+            self.adaptor.logger.info("{} segments to be replayed".format(len(self._sealed)),
+                                     extra=self.adaptor.log_context)
+
+    def _open_segment(self, key: tuple, table_id: str, field_data: List[dict]) -> dict:
+        """Segment receiving the rows of a log table, lock must be held by the caller"""
+        segment = self._open.get(key, None)
+        if segment is not None and (segment["rows"] >= self.segment_rows or segment["size"] >= self.segment_bytes):
+            self._seal(segment)
+            segment = None
+        if segment is None:
+            path = os.path.join(self.wal_dir, "{:012d}{}".format(self._next_seq, self.segment_suffix))
+            self._next_seq += 1
+            fp = open(path, "wb")
+            header = (json.dumps({"table_id": table_id, "field_data": field_data}) + "\n").encode("utf-8")
+            fp.write(header)
+            self._sync_dir()
+            segment = {"key": key, "path": path, "table_id": table_id, "field_data": field_data, "fp": fp,
+                       "rows": 0, "size": len(header), "synced": 0, "created": time.monotonic(),
+                       "sealed": False, "sync_lock": threading.Lock()}
+            self._open[key] = segment
+        return segment
+
+    def _sync(self, segment: dict, position: int):
+        """Group commit: one fsync covers all the rows written before it, whatever the appender
+
+        Args:
+            position (:obj:`int`): Segment size after the rows of the caller, read under the buffer lock
+        """
+        with segment["sync_lock"]:
+            if segment["synced"] >= position:
+                return
+            # Size is raised after the write: the rows counted here are in the file object before the flush.
+            # Rows written during the fsync are not covered, their appenders sync again.
+            target = max(segment["size"], position)
+            segment["fp"].flush()
+            if self.fsync:
+                os.fsync(segment["fp"].fileno())
+            segment["synced"] = target
+
+    def _seal(self, segment: dict):
+        """No more rows for the segment, it could be sent. Lock must be held by the caller"""
+        self._sync(segment, segment["size"])
+        with segment["sync_lock"]:
+            segment["fp"].close()
+            segment["sealed"] = True
+        del self._open[segment["key"]]
+        self._sealed.append(segment)
+        self._wake_event.set()
+
+    def append(self, table_id: str, field_data: List[dict], data: Iterable[dict]) -> int:
+        """Write rows to the buffer, they are durable when the method returns
+
+        Returns:
+            :obj:`int`: Number of acknowledged rows
+        """
+        key = (table_id, json.dumps(field_data, sort_keys=True))
+        row_count, to_sync = 0, []
+        with self._lock:
+            segment = self._open_segment(key, table_id, field_data)
+            for line in data:
+                if segment["rows"] >= self.segment_rows or segment["size"] >= self.segment_bytes:
+                    segment = self._open_segment(key, table_id, field_data)
+                payload = (json.dumps(line, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                segment["fp"].write(payload)
+                segment["rows"] += 1
+                segment["size"] += len(payload)
+                row_count += 1
+            to_sync = (segment, segment["size"])
+        # Sealed segments are synced already, only the last one could still need it
+        if not to_sync[0]["sealed"]:
+            self._sync(*to_sync)
+        return row_count
+
+    def _read_rows(self, path: str):
+        with open(path, "rb") as fp:
+            fp.readline()
+            for line in fp:
+                if not line.endswith(b"\n"):
+                    break  # Truncated by a crash, never acknowledged
+                yield json.loads(line)
+
+    def _send(self, segment: dict) -> bool:
+        kwargs = {"ingestion_mode": self.ingestion_mode} if self.ingestion_mode else {}
+        try:
+            result = self.adaptor.append_log_data(segment["table_id"], segment["field_data"],
+                                                  self._read_rows(segment["path"]), **kwargs)
+        except Exception as e:
+            self.adaptor.logger.error("Segment {} send error: {}".format(segment["path"], e),
+                                      extra=self.adaptor.log_context)
+            result = False
+        if not result:
+            self.stats["send_failures"] += 1
+            segment["attempts"] = segment.get("attempts", 0) + 1
+            if segment["attempts"] >= self.max_attempts:
+                self._dead_letter(segment)
+            return False
+        os.remove(segment["path"])
+        self._sync_dir()
+        self.stats["segments_sent"] += 1
+        self.stats["rows_sent"] += segment["rows"]
+        return True
+
+    def _dead_letter(self, segment: dict):
+        """Move a segment out of the replayed files, it is kept for inspection"""
+        dead_path = segment["path"][:-len(self.segment_suffix)] + self.dead_suffix
+        os.replace(segment["path"], dead_path)
+        self._sync_dir()
+        segment["dead"] = True
+        self.stats["segments_dead"] += 1
+        self.adaptor.logger.error("Segment {} failed {} times, moved to {}".format(
+            segment["path"], segment["attempts"], dead_path), extra=self.adaptor.log_context)
+
+    def flush(self, table_id: str = None, max_age: float = 0) -> bool:
+        """Seal and send the buffered rows of the given log table, of all log tables if no table is given
+
+        Args:
+            max_age (:obj:`float`): Only seal the open segments older than this (seconds)
+
+        Returns:
+            :obj:`bool`: False if a segment could not be sent (it stays in the buffer, unless moved to a
+                dead-letter file)
+        """
+        now = time.monotonic()
+        with self._lock:
+            for segment in list(self._open.values()):
+                if (table_id is None or segment["table_id"] == table_id) and now - segment["created"] >= max_age:
+                    self._seal(segment)
+        result = True
+        with self._send_lock:
+            with self._lock:
+                segments = [segment for segment in self._sealed if table_id is None or segment["table_id"] == table_id]
+            for segment in segments:
+                sent = self._send(segment)
+                if sent or segment.get("dead", False):
+                    with self._lock:
+                        self._sealed.remove(segment)
+                result = result and sent
+        return result
+
+    def pending(self) -> dict:
+        """Number of segments and rows not sent yet"""
+        with self._lock:
+            segments = list(self._open.values()) + self._sealed
+            return {"segments": len(segments), "rows": sum(segment["rows"] for segment in segments)}
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            self.flush(max_age=self.flush_interval)
+
+    def close(self, drain: bool = True) -> bool:
+        """Stop the flusher, then send everything still buffered (or only seal it if drain is False)"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._flusher.is_alive() and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        if drain:
+            return self.flush()
+        with self._lock:
+            for segment in list(self._open.values()):
+                self._seal(segment)
+        return True